@@ -1,115 +1,468 @@
 import cv2
 import pytesseract
-from PIL import Image
 import re
 import numpy as np
-from ultralytics import YOLO  
 import os
+import json
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from result_cache import ResultCache, hash_file
+import metrics
 
-MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models', 'best.pt')
-try:
-    model = YOLO(MODEL_PATH)
-    print("--- [System] YOLOv8 model loaded successfully! ---")
-except Exception as e:
-    print(f"--- [System] Model loading failed: {e} ---")
-    model = None
+# --- Model Settings (override with environment variables) ---
+# AI_BACKEND: "pytorch" (best.pt), "onnx" (best.onnx) or "openvino" (best_openvino_model/)
+MODEL_DIR = os.path.join(os.path.dirname(__file__), 'models')
+MODEL_PATH = os.path.join(MODEL_DIR, 'best.pt')
+BACKEND_PATHS = {
+    "pytorch": MODEL_PATH,
+    "onnx": os.path.join(MODEL_DIR, 'best.onnx'),
+    "openvino": os.path.join(MODEL_DIR, 'best_openvino_model'),
+}
+BACKEND = os.environ.get('AI_BACKEND', 'pytorch').lower()
+IMGSZ = int(os.environ.get('AI_IMGSZ', 640))
+# Exported models have a static input shape, batch dimension included: AI_EXPORT_BATCH
+# images per call (1 suits single uploads; match AI_BATCH_SIZE for bulk-heavy servers)
+EXPORT_BATCH = int(os.environ.get('AI_EXPORT_BATCH', 1))
+
+# --- Metrics (exposed on /metrics) ---
+STAGE_SECONDS = metrics.Histogram('ai_stage_seconds', 'Time per analyzer stage', ('stage',))
+IMAGES = metrics.Counter('ai_images_total', 'Images analyzed', ('mode',))
+CACHE_REQUESTS = metrics.Counter('ai_cache_requests_total', 'Result cache lookups', ('result',))
+
+# The model is loaded on first use (see get_model), not at import time,
+# so importing this module doesn't pull in torch / ultralytics.
+model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+def weights_path(backend=None):
+    return BACKEND_PATHS.get(backend or BACKEND, MODEL_PATH)
+
+def get_model():
+    global model, _model_loaded
+    if _model_loaded: return model
+    with _model_lock:
+        if _model_loaded: return model
+        path = weights_path()
+        started = time.perf_counter()
+        try:
+            from ultralytics import YOLO
+            # Exported backends don't carry the task name, so tell Ultralytics
+            model = YOLO(path) if BACKEND == "pytorch" else YOLO(path, task="detect")
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='model_load')
+            metrics.log("System", message="model loaded", backend=BACKEND, seconds=round(time.perf_counter() - started, 2))
+        except Exception as e:
+            metrics.log("System", message="model loading failed", backend=BACKEND, error=str(e))
+            model = None
+        _model_loaded = True
+    return model
+
+def warm_up():
+    # One dummy inference so the first real upload doesn't pay for graph setup
+    m = get_model()
+    if not m: return False
+    started = time.perf_counter()
+    infer([np.zeros((IMGSZ, IMGSZ, 3), dtype=np.uint8)], verbose=False)
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage='warm_up')
+    metrics.log("System", message="model warm-up done", seconds=round(time.perf_counter() - started, 2))
+    return True
+
+def export_model(backend):
+    # Build best.onnx / best_openvino_model/ from best.pt with a static IMGSZ x IMGSZ input
+    # and EXPORT_BATCH images per call; infer() splits and pads inputs to that batch
+    from ultralytics import YOLO
+    exported = YOLO(MODEL_PATH).export(format=backend, imgsz=IMGSZ, dynamic=False, batch=EXPORT_BATCH)
+    print(f"--- [System] Exported {backend} model to: {exported} ---")
+    return exported
+
+def infer(sources, **kwargs):
+    # One result per source. PyTorch takes any batch; a static export takes exactly
+    # EXPORT_BATCH, so inputs go in groups of that size, the last one padded by repeating its final image.
+    model = get_model()
+    if BACKEND == "pytorch": return list(model(sources, batch=len(sources), imgsz=IMGSZ, **kwargs))
+    results = []
+    for start in range(0, len(sources), EXPORT_BATCH):
+        group = sources[start:start + EXPORT_BATCH]
+        padded = group + [group[-1]] * (EXPORT_BATCH - len(group))
+        results.extend(list(model(padded, batch=EXPORT_BATCH, imgsz=IMGSZ, **kwargs))[:len(group)])
+    return results
+
+# Cache entries are only valid for the weights that produced them
+_model_version = None
+
+def model_version():
+    global _model_version
+    if _model_version is None:
+        path = weights_path()
+        if os.path.isdir(path):
+            digest = "".join(hash_file(os.path.join(path, f)) for f in sorted(os.listdir(path)) if os.path.isfile(os.path.join(path, f)))
+            _model_version = f"{BACKEND}-{hashlib.sha256(digest.encode()).hexdigest()[:16]}"
+        elif os.path.exists(path):
+            _model_version = f"{BACKEND}-{hash_file(path)[:16]}"
+        else:
+            _model_version = "no-model"
+    return _model_version
+
+result_cache = ResultCache() if os.environ.get('AI_CACHE', '1') == '1' else None
+
+# --- 0. Shared Image Decode (Read the file once for OCR and YOLO) ---
+def load_image(image_path):
+    # Returns a BGR array (OpenCV / Ultralytics layout), or None if unreadable
+    with STAGE_SECONDS.time(stage='decode'):
+        return cv2.imread(image_path)
 
 # --- 1. OCR Function (Keep! Responsible for reading ID) ---
-def analyze_image_with_ocr(image_path):
+# Tesseract is the slowest step on big phone photos, so we hand it a small,
+# clean crop: downscale -> find the label/text region -> binarize.
+OCR_MAX_SIDE = int(os.environ.get('OCR_MAX_SIDE', 1600))
+OCR_PSM = int(os.environ.get('OCR_PSM', 11)) # 11 = sparse text, suits shipping labels
+OCR_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-"
+OCR_CONFIG = f"--psm {OCR_PSM} -c tessedit_char_whitelist={OCR_WHITELIST}"
+ID_PATTERN = re.compile(r'(P-[\d-]+|SPX[A-Z0-9]+|\d{10,})', re.IGNORECASE)
+
+def downscale(gray, max_side=OCR_MAX_SIDE):
+    h, w = gray.shape[:2]
+    factor = max_side / max(h, w)
+    if factor >= 1: return gray
+    return cv2.resize(gray, (int(w * factor), int(h * factor)), interpolation=cv2.INTER_AREA)
+
+def find_text_region(gray, pad=20):
+    # Cheap text-region pass: strong horizontal gradients, closed into blocks
+    grad = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+    _, mask = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (25, 5)))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    h, w = gray.shape[:2]
+    best, best_score = None, 0
+    for c in contours:
+        x, y, cw, ch = cv2.boundingRect(c)
+        # Text lines are wide and short; skip specks and whole-image blobs
+        if cw < 40 or ch < 10 or cw < ch * 1.5 or cw * ch > 0.8 * w * h: continue
+        score = cv2.countNonZero(mask[y:y + ch, x:x + cw])
+        if score > best_score:
+            best, best_score = (x, y, cw, ch), score
+    if best is None: return None
+    x, y, cw, ch = best
+    return max(x - pad, 0), max(y - pad, 0), min(x + cw + pad, w), min(y + ch + pad, h)
+
+def binarize(gray):
+    blurred = cv2.GaussianBlur(gray, (3, 3), 0)
+    _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    return binary
+
+def read_id(binary):
+    text = pytesseract.image_to_string(binary, config=OCR_CONFIG)
+    if not text: return None, False
+    cleaned_text = " ".join(text.split()).upper()
+    # Look for P-xxxx or SPX... or 10+ digit numbers
+    match = ID_PATTERN.search(cleaned_text)
+    return (match.group(0).upper() if match else None), True
+
+def analyze_image_with_ocr(image_path, image=None, roi=None, timings=None):
+    # roi: optional (x1, y1, x2, y2) label box in original image pixels
+    timings = timings if timings is not None else {}
     try:
-        img = Image.open(image_path)
-        text = pytesseract.image_to_string(img)
-        if not text: return "OCR_No_Text"
-        cleaned_text = " ".join(text.split()).upper()
-        # Look for P-xxxx or SPX... or 10+ digit numbers
-        match = re.search(r'(P-[\d-]+|SPX[A-Z0-9]+|\d{10,})', cleaned_text, re.IGNORECASE)
-        return match.group(0).upper() if match else "OCR_ID_Not_Found"
+        t = time.perf_counter()
+        if image is None: image = cv2.imread(image_path)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if roi:
+            x1, y1, x2, y2 = (int(v) for v in roi)
+            gray = gray[y1:y2, x1:x2]
+        small = downscale(gray)
+        timings['prepare'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        region = None if roi else find_text_region(small)
+        crop = small[region[1]:region[3], region[0]:region[2]] if region else small
+        timings['locate'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        binary = binarize(crop)
+        timings['binarize'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        parcel_id, had_text = read_id(binary)
+        # The crop can miss the label; try the whole (downscaled) photo once
+        if parcel_id is None and region:
+            parcel_id, more_text = read_id(binarize(small))
+            had_text = had_text or more_text
+        timings['tesseract'] = time.perf_counter() - t
+
+        if parcel_id: return parcel_id
+        return "OCR_ID_Not_Found" if had_text else "OCR_No_Text"
     except:
         return "Error"
+    finally:
+        for stage, seconds in timings.items(): STAGE_SECONDS.observe(seconds, stage='ocr_' + stage)
 
 # --- 2. YOLO Function (Upgraded: Saves the image!) ---
-def estimate_dimensions_yolo(image_path):
+# AI_RENDER_MODE decides when the "_predicted" image with boxes is drawn:
+#   "off"        -> never
+#   "on-demand"  -> only when a page asks for it (drawn from the saved boxes)
+#   "background" -> right after inference, but off the request thread
+RENDER_MODE = os.environ.get('AI_RENDER_MODE', 'on-demand').lower()
+render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-render")
+PREDICTED_MAX_PX = int(os.environ.get('AI_PREDICTED_MAX_PX', 1280)) # the drawing is for a web page, not a full-size copy
+CLASS_NAMES = {0: "parcel", 1: "ruler"}
+CLASS_COLORS = {0: (0, 191, 255), 1: (80, 175, 76)} # BGR
+
+def predicted_path(image_path):
+    # Generate new filename: e.g., "uploads/123.jpg" -> "uploads/123_predicted.webp"
+    return os.path.splitext(image_path)[0] + "_predicted.webp"
+
+def boxes_path(image_path):
+    return os.path.splitext(image_path)[0] + "_boxes.json"
+
+def save_boxes(image_path, r):
+    # Keep [x1, y1, x2, y2, cls, conf] per box so the image can be drawn later without the model
+    boxes = np.concatenate([r.boxes.xyxy.cpu().numpy(), r.boxes.cls.cpu().numpy()[:, None], r.boxes.conf.cpu().numpy()[:, None]], axis=1) if len(r.boxes) else np.zeros((0, 6))
+    with open(boxes_path(image_path), 'w') as f:
+        json.dump(boxes.round(2).tolist(), f)
+
+def render_predicted_image(image_path):
+    # Draw the saved boxes onto the original photo
+    started = time.perf_counter()
+    with open(boxes_path(image_path)) as f:
+        boxes = json.load(f)
+    im_array = cv2.imread(image_path)
+    if im_array is None: return None
+    # Downscale first and scale the boxes with it, so lines and labels keep their size
+    scale = min(PREDICTED_MAX_PX / max(im_array.shape[:2]), 1.0)
+    if scale < 1: im_array = cv2.resize(im_array, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    number = 0
+    for x1, y1, x2, y2, cls, conf in boxes:
+        x1, y1, x2, y2 = (int(v * scale) for v in (x1, y1, x2, y2))
+        color = CLASS_COLORS.get(int(cls), (0, 0, 255))
+        # Parcels are numbered in the same order as the confirm page lists them
+        name = CLASS_NAMES.get(int(cls), int(cls))
+        if int(cls) == PARCEL_CLASS:
+            number += 1; name = f"{name} {number}"
+        cv2.rectangle(im_array, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(im_array, f"{name} {conf:.2f}", (x1, max(y1 - 6, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    save_path = predicted_path(image_path)
+    cv2.imwrite(save_path, im_array, [cv2.IMWRITE_WEBP_QUALITY, 80]) # Save image
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage='render')
+    metrics.log("AI", message="predicted image saved", path=save_path)
+    return save_path
+
+def ensure_predicted_image(image_path):
+    # On-demand entry point for the web pages: returns None if it can't be drawn
+    save_path = predicted_path(image_path)
+    if os.path.exists(save_path): return save_path
+    if RENDER_MODE == "off" or not os.path.exists(boxes_path(image_path)): return None
+    return render_predicted_image(image_path)
+
+def handle_render(image_path, r):
+    # A new inference makes any older drawing of this file stale
+    if os.path.exists(predicted_path(image_path)): os.remove(predicted_path(image_path))
+    save_boxes(image_path, r)
+    if RENDER_MODE == "background":
+        render_executor.submit(render_predicted_image, image_path)
+
+# --- Measurement: every parcel box in the photo, one NumPy pass ---
+# Scale (cm per pixel) comes from the ruler: its longest side is RULER_CM long.
+# With several rulers in view the median scale is used; with none, DEFAULT_SCALE.
+PARCEL_CLASS, RULER_CLASS = 0, 1
+RULER_CM = float(os.environ.get('AI_RULER_CM', 30.0))
+DEFAULT_SCALE = 0.05
+KG_PER_M3 = 30 # rough weight estimate from volume
+
+def fallback(volume, dims):
+    # Stand-in detection when there is nothing to measure
+    return [{"dimensions": dims, "volume": volume, "weight": round(volume * KG_PER_M3, 2), "box": None}]
+
+def measure_boxes(xywh, cls):
+    # xywh: (N, 4) [x_center, y_center, width, height] in image pixels, cls: (N,) class ids.
+    # Returns one dict per parcel box, in the detector's (confidence) order.
+    xywh = np.asarray(xywh, dtype=np.float64).reshape(-1, 4)
+    cls = np.asarray(cls).reshape(-1).astype(int)
+    parcels = xywh[cls == PARCEL_CLASS]
+    if not len(parcels): return fallback(0.05, "No Parcel Found")
+
+    rulers = xywh[cls == RULER_CLASS, 2:].max(axis=1)
+    if len(rulers): scale = float(np.median(RULER_CM / rulers))
+    else:
+        metrics.log("AI", message="no ruler detected, using default scale", scale=DEFAULT_SCALE)
+        scale = DEFAULT_SCALE
+
+    # Width and height from the photo, depth guessed as half the shorter side
+    w_cm, h_cm = parcels[:, 2] * scale, parcels[:, 3] * scale
+    d_cm = np.minimum(w_cm, h_cm) * 0.5
+    volume = np.round(w_cm * h_cm * d_cm / 1_000_000, 4)
+    weight = np.round(volume * KG_PER_M3, 2)
+    corners = np.concatenate([parcels[:, :2] - parcels[:, 2:] / 2, parcels[:, :2] + parcels[:, 2:] / 2], axis=1)
+    corners = np.maximum(corners, 0).round(1) # a box can poke out of the frame
+    dims = np.stack([w_cm, h_cm, d_cm], axis=1).astype(int)
+    return [{"dimensions": f"{w}*{h}*{d}cm", "volume": v, "weight": kg, "box": box}
+            for (w, h, d), v, kg, box in zip(dims.tolist(), volume.tolist(), weight.tolist(), corners.tolist())]
+
+def measure_result(r):
+    if not len(r.boxes): return fallback(0.05, "No Parcel Found")
+    return measure_boxes(r.boxes.xywh.cpu().numpy(), r.boxes.cls.cpu().numpy())
+
+def estimate_dimensions_yolo(image_path, image=None):
+    model = get_model()
     if not model:
-        return 0.1, "Model Error"
+        return fallback(0.1, "Model Error")
 
-    # Run inference
-    results = model(image_path)
-    
-    # --- New Feature: Save image with bounding boxes ---
-    # This will append "_predicted.jpg" to the original filename and save in the same folder
+    # Run inference (on the already decoded array if given)
+    with STAGE_SECONDS.time(stage='yolo'):
+        results = infer([image if image is not None else image_path])
+
+    # --- Boxes are saved, the annotated image is drawn later (see RENDER_MODE) ---
     for r in results:
-        im_array = r.plot()  # Plot boxes on the image
-        # Generate new filename: e.g., "uploads/123.jpg" -> "uploads/123_predicted.jpg"
-        save_path = image_path.replace(".jpg", "_predicted.jpg").replace(".jpeg", "_predicted.jpg").replace(".png", "_predicted.png")
-        cv2.imwrite(save_path, im_array) # Save image
-        print(f"--- [AI] Predicted image saved to: {save_path} ---")
+        handle_render(image_path, r)
     # --------------------------------
 
-    # Get detected boxes
-    parcel_box = None
-    ruler_box = None
+    # Only one image goes in, so the last result is the one we measure
+    with STAGE_SECONDS.time(stage='measure'):
+        return measure_result(results[-1])
 
-    for r in results:
-        boxes = r.boxes
-        for box in boxes:
-            cls = int(box.cls[0]) # Class ID
-            # box.xywh returns [x_center, y_center, width, height]
-            w = float(box.xywh[0][2])
-            h = float(box.xywh[0][3])
-            
-            # Take the longest side as "length" (pixels)
-            pixel_length = max(w, h)
-
-            if cls == 0: # Parcel (Assuming 0 is Parcel)
-                parcel_box = pixel_length
-                p_w, p_h = w, h
-            elif cls == 1: # Ruler (Assuming 1 is Ruler)
-                ruler_box = pixel_length
-
-    # --- Core Algorithm: Ratio Conversion ---
-    
-    # Case A: No parcel found
-    if parcel_box is None:
-        return 0.05, "No Parcel Found"
-
-    # Case B: Parcel found, but no ruler found
-    if ruler_box is None:
-        print("--- [AI] Warning: No ruler detected, using default scale ---")
-        scale = 0.05 
-    else:
-        # Case C: Perfect!
-        REAL_RULER_LENGTH_CM = 30.0 
-        scale = REAL_RULER_LENGTH_CM / ruler_box
-    
-    # Calculate real parcel dimensions (cm)
-    real_w_cm = p_w * scale
-    real_h_cm = p_h * scale
-    real_d_cm = min(real_w_cm, real_h_cm) * 0.5 
-
-    # Calculate volume (m3)
-    volume_m3 = (real_w_cm * real_h_cm * real_d_cm) / 1_000_000
-    
-    dims_str = f"{int(real_w_cm)}*{int(real_h_cm)}*{int(real_d_cm)}cm"
-
-    return round(volume_m3, 4), dims_str
+# --- 2b. Batched YOLO (Bulk upload: many images per model call) ---
+BATCH_SIZE = int(os.environ.get('AI_BATCH_SIZE', 16))
+
+def estimate_dimensions_yolo_batch(image_paths, batch_size=BATCH_SIZE):
+    model = get_model()
+    if not model:
+        return [fallback(0.1, "Model Error") for _ in image_paths]
+
+    measurements = []
+    for start in range(0, len(image_paths), batch_size):
+        chunk = image_paths[start:start + batch_size]
+        # Ultralytics stacks a list of sources into one tensor batch
+        with STAGE_SECONDS.time(stage='yolo_batch'):
+            results = infer(chunk)
+        for image_path, r in zip(chunk, results):
+            handle_render(image_path, r)
+            with STAGE_SECONDS.time(stage='measure'):
+                measurements.append(measure_result(r))
+    return measurements
 
 # --- 3. Main Function ---
-def analyze_parcel_image(image_path):
-    print(f"--- [AI Analyzer] Analyzing: {image_path} ---")
-    
+# OCR (tesseract subprocess) and YOLO (torch) both release the GIL,
+# so a small thread pool lets the two stages overlap.
+STAGE_WORKERS = int(os.environ.get('AI_STAGE_WORKERS', 2))
+stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="ai-stage")
+
+def cache_key_for(image_path):
+    with STAGE_SECONDS.time(stage='cache_key'):
+        return ResultCache.make_key(hash_file(image_path), model_version())
+
+def cache_lookup(key):
+    result = result_cache.get(key)
+    CACHE_REQUESTS.inc(result='hit' if result else 'miss')
+    return result
+
+def build_result(image_path, parcel_id, detections, executor, image=None):
+    # One result per photo: the first parcel at the top level (what single-parcel
+    # pages use) and every detection under "parcels". With several parcels in view
+    # each label is read inside its own box; the whole-photo read would find just one.
+    if len(detections) > 1:
+        if image is None: image = load_image(image_path)
+        ids = list(executor.map(lambda d: analyze_image_with_ocr(image_path, image, d["box"]), detections))
+    else:
+        ids = [parcel_id]
+    parcels = [dict(d, external_id=i) for d, i in zip(detections, ids)]
+    first = parcels[0]
+    return {"external_id": first["external_id"], "dimensions": first["dimensions"],
+            "weight": first["weight"], "volume": first["volume"], "parcels": parcels}
+
+def cacheable(result):
+    # Don't remember fallback answers from a missing model or a failed OCR run
+    return get_model() and all(p["external_id"] != "Error" for p in result["parcels"])
+
+def analyze_parcel_image(image_path, executor=None):
+    metrics.log("AI Analyzer", image=os.path.basename(image_path))
+    executor = executor or stage_executor
+    started = time.perf_counter()
+    IMAGES.inc(mode='single')
+
+    # Same photo uploaded again? Skip tesseract and the model entirely
+    cache_key = cache_key_for(image_path) if result_cache else None
+    if cache_key:
+        cached = cache_lookup(cache_key)
+        if cached:
+            metrics.log("AI Result", image=os.path.basename(image_path), cached=True, **cached)
+            return cached
+
+    # Decode once, then share the array between both stages
+    image = load_image(image_path)
+
     # Parallel work: One reads text, one looks at image
-    parcel_id = analyze_image_with_ocr(image_path)
-    volume, dims = estimate_dimensions_yolo(image_path)
-    
-    # Estimate weight
-    weight = round(volume * 30, 2) 
-
-    final_results = {
-        "external_id": parcel_id,
-        "dimensions": dims,
-        "weight": weight,
-        "volume": volume
+    ocr_timings = {}
+    ocr_future = executor.submit(analyze_image_with_ocr, image_path, image, None, ocr_timings)
+    detections = estimate_dimensions_yolo(image_path, image)
+    parcel_id = ocr_future.result()
+    metrics.log("AI Timing", image=os.path.basename(image_path), **{f"ocr_{k}_ms": round(v * 1000, 1) for k, v in ocr_timings.items()})
+
+    final_results = build_result(image_path, parcel_id, detections, executor, image)
+
+    if cache_key and cacheable(final_results):
+        result_cache.put(cache_key, final_results)
+
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage='total')
+    metrics.log("AI Result", image=os.path.basename(image_path), cached=False, **final_results)
+    return final_results
+
+# --- 4. Bulk Function (Many images, batched inference) ---
+def _read_ids(image_paths):
+    started = time.perf_counter()
+    parcel_ids = [analyze_image_with_ocr(path) for path in image_paths]
+    return parcel_ids, time.perf_counter() - started
+
+def analyze_parcel_images(image_paths, batch_size=BATCH_SIZE, executor=None):
+    metrics.log("AI Analyzer", bulk=True, images=len(image_paths), batch_size=batch_size)
+    executor = executor or stage_executor
+    started = time.perf_counter()
+    IMAGES.inc(len(image_paths), mode='bulk')
+
+    # Serve repeats from the cache, only analyze the rest
+    all_results = [None] * len(image_paths)
+    cache_keys = [cache_key_for(path) for path in image_paths] if result_cache else [None] * len(image_paths)
+    if result_cache:
+        for i, key in enumerate(cache_keys):
+            all_results[i] = cache_lookup(key)
+    todo = [i for i, r in enumerate(all_results) if r is None]
+    todo_paths = [image_paths[i] for i in todo]
+
+    # OCR for the whole set overlaps with the batched YOLO calls
+    yolo_started = time.perf_counter()
+    ocr_future = executor.submit(_read_ids, todo_paths)
+    measurements = estimate_dimensions_yolo_batch(todo_paths, batch_size)
+    yolo_seconds = time.perf_counter() - yolo_started
+    parcel_ids, ocr_seconds = ocr_future.result()
+
+    for i, parcel_id, detections in zip(todo, parcel_ids, measurements):
+        all_results[i] = build_result(image_paths[i], parcel_id, detections, executor)
+        if cache_keys[i] and cacheable(all_results[i]):
+            result_cache.put(cache_keys[i], all_results[i])
+    finished = time.perf_counter()
+
+    total = finished - started
+    count = len(image_paths)
+    stats = {
+        "count": count,
+        "batch_size": batch_size,
+        "cache_hits": count - len(todo),
+        "parcels": sum(len(r.get("parcels") or [r]) for r in all_results),
+        "ocr_seconds": round(ocr_seconds, 3),
+        "yolo_seconds": round(yolo_seconds, 3),
+        "total_seconds": round(total, 3),
+        "images_per_second": round(count / total, 2) if total > 0 else 0.0,
+        "ms_per_image": round(total * 1000 / count, 1) if count else 0.0
     }
-    
-    print(f"--- [AI Result] {final_results} ---")
-    return final_results
\ No newline at end of file
+    STAGE_SECONDS.observe(total, stage='bulk_total')
+    metrics.log("AI Result", bulk=True, **stats)
+    return all_results, stats
+
+
+# --- CLI: python ai_analyzer.py export onnx|openvino ---
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) == 3 and sys.argv[1] == "export":
+        export_model(sys.argv[2])
+    else:
+        print("Usage: python ai_analyzer.py export onnx|openvino")
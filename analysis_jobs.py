@@ -0,0 +1,151 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from ai_analyzer import analyze_parcel_image, analyze_parcel_images
+from result_cache import CACHE_PATH
+import metrics
+
+# --- Settings (override with environment variables) ---
+WORKER_COUNT = int(os.environ.get('ANALYSIS_WORKERS', 2))
+QUEUE_SIZE = int(os.environ.get('ANALYSIS_QUEUE_SIZE', 32))
+MAX_KEPT_JOBS = int(os.environ.get('ANALYSIS_MAX_KEPT_JOBS', 500))
+# Job state is also written here, one JSON file per job, so a status poll that lands on
+# another gunicorn worker (or after a restart) still finds the job. Must be shared by all workers.
+JOB_DIR = os.environ.get('ANALYSIS_JOB_DIR', os.path.join(os.path.dirname(CACHE_PATH), 'jobs'))
+JOB_TTL = int(os.environ.get('ANALYSIS_JOB_TTL', 24 * 3600)) # seconds a job file is kept
+
+class QueueFullError(Exception):
+    pass
+
+class AnalysisJob:
+    # kind 'single': one photo, result is the analyzer dict.
+    # kind 'bulk': image_path / image_filename are lists, result is {"results": [...], "stats": {...}}
+    def __init__(self, image_path, image_filename, kind='single'):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.image_path = image_path
+        self.image_filename = image_filename
+        self.status = 'queued' # queued -> running -> done / failed
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        return {"id": self.id, "kind": self.kind, "status": self.status, "image_filename": self.image_filename,
+                "result": self.result, "error": self.error}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f: data = json.load(f)
+        job = cls(data.get("image_path"), data["image_filename"], data.get("kind", 'single'))
+        job.id, job.status, job.result, job.error = data["id"], data["status"], data["result"], data["error"]
+        job.created, job.finished = data.get("created"), data.get("finished")
+        return job
+
+    def save(self, directory):
+        # Atomic: a reader sees the old state or the new one, never half a file
+        data = dict(self.to_dict(), image_path=self.image_path, created=self.created, finished=self.finished)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f: json.dump(data, f)
+        os.replace(tmp, os.path.join(directory, self.id + '.json'))
+
+# --- Job Queue: local worker threads, no external broker ---
+# The work runs in the process that took the upload; only the state is shared (JOB_DIR).
+class AnalysisQueue:
+    def __init__(self, analyze=analyze_parcel_image, analyze_many=analyze_parcel_images, workers=WORKER_COUNT, queue_size=QUEUE_SIZE,
+                 max_kept=MAX_KEPT_JOBS, job_dir=JOB_DIR):
+        self.analyze = analyze
+        self.analyze_many = analyze_many
+        self.workers = workers
+        self.max_kept = max_kept
+        self.job_dir = job_dir
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._swept = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._threads: return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._work, name=f"analysis-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            os.makedirs(self.job_dir, exist_ok=True)
+        metrics.log("Jobs", message="analysis workers started", workers=self.workers, queue_size=self._queue.maxsize)
+
+    def submit(self, image_path, image_filename, kind='single'):
+        self.start()
+        job = AnalysisJob(image_path, image_filename, kind)
+        # Saved before a worker can pick it up, so the file never goes back to 'queued'
+        job.save(self.job_dir)
+        # Backpressure: refuse new work instead of growing without limit
+        try: self._queue.put_nowait(job)
+        except queue.Full:
+            os.remove(os.path.join(self.job_dir, job.id + '.json'))
+            raise QueueFullError("Analysis queue is full, please retry shortly.")
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+            self._sweep()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job: return job
+        # Submitted to another worker process
+        if not job_id.isalnum(): return None
+        try: return AnalysisJob.load(os.path.join(self.job_dir, job_id + '.json'))
+        except (OSError, ValueError, KeyError): return None
+
+    def pending(self):
+        # This process's queue only
+        return self._queue.qsize()
+
+    def _trim(self):
+        # Drop the oldest finished jobs once we keep too many
+        if len(self._jobs) <= self.max_kept: return
+        for job_id in [j.id for j in self._jobs.values() if j.finished][:len(self._jobs) - self.max_kept]:
+            del self._jobs[job_id]
+
+    def _sweep(self):
+        # Job files past their TTL, whichever process wrote them; at most once a minute
+        now = time.time()
+        if now - self._swept < 60: return
+        self._swept = now
+        for entry in os.scandir(self.job_dir):
+            try:
+                if entry.stat().st_mtime < now - JOB_TTL: os.remove(entry.path)
+            except OSError: pass
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status = 'running'
+            try:
+                job.save(self.job_dir)
+                if job.kind == 'bulk':
+                    # One job for the whole set keeps the batched inference
+                    results, stats = self.analyze_many(job.image_path)
+                    job.result = {"results": results, "stats": stats}
+                else:
+                    job.result = self.analyze(job.image_path)
+                job.status = 'done'
+            except Exception as e:
+                job.error = str(e)
+                job.status = 'failed'
+            job.finished = time.time()
+            try: job.save(self.job_dir)
+            except Exception as e: metrics.log("Jobs", message="could not save job state", job=job.id, error=str(e))
+            self._queue.task_done()
+
+jobs = AnalysisQueue()
@@ -1,23 +1,47 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, desc, or_
+from sqlalchemy import func, or_, and_, update, case, event
+from sqlalchemy.orm import joinedload, aliased
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from ai_analyzer import analyze_parcel_image
+from ai_analyzer import result_cache, warm_up, ensure_predicted_image, ID_PATTERN
+from analysis_jobs import jobs, QueueFullError
+import search_index
+import metrics
+import image_store
+import database
+import bulk_io
+import batch_planner
+import batch_states
+import route_planner
+import numpy as np
 import os
 import datetime
+import hashlib
+import hmac
+import random
+import re
+import time
+import uuid
+import zipfile
+import tempfile
+import click
+import threading
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key_12345'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'project.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = database.database_uri('sqlite:///' + os.path.join(basedir, 'project.db'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
-app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'static', 'uploads')
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+app.config['UPLOAD_FOLDER'] = image_store.HOT_DIR
+app.add_template_filter(image_store.label, 'image_label')
 
 db = SQLAlchemy(app)
+with app.app_context(): database.configure(db.engine)
 
 # --- Models ---
 class User(db.Model):
@@ -41,30 +65,141 @@ class Vehicle(db.Model):
     capacity_m3 = db.Column(db.Float, nullable=False, default=1.0) 
     status = db.Column(db.String(30), nullable=False, default='Available') 
     batches = db.relationship('Batch', backref='vehicle', lazy=True)
+    # Driver dashboard matches on lower(driver_name)
+    __table_args__ = (db.Index('ix_vehicle_driver_name_lower', func.lower(driver_name)),)
 
 class Batch(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     batch_name = db.Column(db.String(50), unique=True, nullable=False)
-    batch_type = db.Column(db.String(20), nullable=False)
+    batch_type = db.Column(db.String(20), nullable=False, index=True)
     current_volume = db.Column(db.Float, default=0.0)
     max_volume = db.Column(db.Float, default=0.82)
     max_capacity = db.Column(db.Float, default=90.0)
-    status = db.Column(db.String(30), default='In Progress') # In Progress -> Ready -> Transporting -> Completed
+    status = db.Column(db.String(30), default='In Progress', index=True) # see batch_states
     completion_time = db.Column(db.DateTime, nullable=True)
-    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=True, index=True)
     parcels = db.relationship('Parcel', backref='batch', lazy=True)
 
 class Parcel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    external_parcel_id = db.Column(db.String(100), nullable=True)
+    external_parcel_id = db.Column(db.String(100), nullable=True, index=True)
     dimensions = db.Column(db.String(50), nullable=True)
     weight = db.Column(db.Float, nullable=True)
     estimated_volume = db.Column(db.Float, default=0.0)
     parcel_name = db.Column(db.String(100))
     delivery_address = db.Column(db.String(200), nullable=False, default="Factory Client A")
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id'), nullable=True)
-    created_time = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch.id'), nullable=True, index=True)
+    created_time = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+
+# Every batch status change goes through this (rules in batch_states.py)
+lifecycle = batch_states.BatchLifecycle(Batch, Vehicle)
+
+# Pre-computed dashboard counters, kept up to date in the same transaction as the change:
+#   parcels_total / ""          -> all parcels
+#   parcels_day / "2024-05-01"  -> parcels created that (UTC) day
+#   batches_type / "small"      -> batches per batch_type
+#   vehicle_batches / "Van"     -> batches assigned to a vehicle of that type
+class Stat(db.Model):
+    metric = db.Column(db.String(30), primary_key=True)
+    bucket = db.Column(db.String(50), primary_key=True, default='')
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+def bump_stat(metric, bucket='', delta=1):
+    # Atomic "value = value + delta" upsert, no read-modify-write
+    if not delta: return
+    insert = pg_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    stmt = insert(Stat).values(metric=metric, bucket=bucket, value=delta)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['metric', 'bucket'], set_={'value': Stat.value + delta}))
+
+def bump_parcel_stats(day_counts, sign=1):
+    # day_counts: {"2024-05-01": n, ...}
+    for day, n in day_counts.items():
+        bump_stat('parcels_day', str(day), sign * n)
+    bump_stat('parcels_total', '', sign * sum(day_counts.values()))
+
+def rebuild_stats():
+    # Backfill / repair: recount everything from the base tables
+    Stat.query.delete()
+    for day, n in db.session.query(func.date(Parcel.created_time), func.count(Parcel.id)).group_by(func.date(Parcel.created_time)):
+        if day is not None: bump_stat('parcels_day', str(day), n)
+    bump_stat('parcels_total', '', db.session.query(func.count(Parcel.id)).scalar())
+    for btype, n in db.session.query(Batch.batch_type, func.count(Batch.id)).group_by(Batch.batch_type):
+        bump_stat('batches_type', btype, n)
+    for vtype, n in db.session.query(Vehicle.vehicle_type, func.count(Batch.id)).join(Batch, Batch.vehicle_id == Vehicle.id).group_by(Vehicle.vehicle_type):
+        bump_stat('vehicle_batches', vtype, n)
+    db.session.commit()
+
+@app.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    rebuild_stats()
+    print("--- ✅ Dashboard statistics rebuilt ---")
+
+# --- Instrumentation: /metrics, per-request SQL counts, slow-request logs, sampling profiler ---
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500)) # logged even without LOG_REQUESTS=1
+LOG_REQUESTS = os.environ.get('LOG_REQUESTS') == '1'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0)) # fraction of requests to profile; admins can add ?profile=1
+PROFILE_MIN_MS = float(os.environ.get('PROFILE_MIN_MS', 200)) # sampled profiles of faster requests are dropped
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') # scrapers send "Authorization: Bearer <token>"
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC') == '1' # serve /metrics to anyone (trusted network only)
+
+REQUEST_SECONDS = metrics.Histogram('http_request_seconds', 'Request latency', ('method', 'route', 'status'))
+REQUEST_QUERIES = metrics.Histogram('http_request_sql_queries', 'SQL statements per request', ('route',), buckets=metrics.COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = metrics.Histogram('http_request_sql_seconds', 'Time spent in SQL per request', ('route',))
+SQL_SECONDS = metrics.Histogram('sql_query_seconds', 'SQL statement time', ('statement',))
+metrics.Gauge('analysis_queue_depth', 'Uploads waiting for the analysis workers', lambda: jobs.pending())
+metrics.Gauge('db_pool_checked_out', 'Database connections in use', lambda: db.engine.pool.checkedout())
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+    SQL_SECONDS.observe(seconds, statement=statement.split(None, 1)[0].upper() if statement.strip() else '')
+    if has_request_context() and 'started' in g:
+        g.sql_queries += 1; g.sql_seconds += seconds
+
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', _query_started)
+    event.listen(db.engine, 'after_cursor_execute', _query_finished)
+
+@app.before_request
+def start_request_timer():
+    g.started, g.sql_queries, g.sql_seconds, g.profiler = time.perf_counter(), 0, 0.0, None
+    wanted = request.args.get('profile') == '1' and session.get('is_admin')
+    if wanted or (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        g.profiler = metrics.Profiler().start()
+
+@app.after_request
+def record_request(response):
+    if 'started' not in g: return response
+    seconds = time.perf_counter() - g.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(seconds, method=request.method, route=route, status=response.status_code)
+    REQUEST_QUERIES.observe(g.sql_queries, route=route)
+    REQUEST_SQL_SECONDS.observe(g.sql_seconds, route=route)
+    # Browser dev tools show this under Network -> Timing
+    response.headers['Server-Timing'] = f'app;dur={seconds * 1000:.1f}, db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_queries} queries"'
+    profile = None
+    if g.profiler:
+        g.profiler.stop()
+        if seconds * 1000 >= PROFILE_MIN_MS or request.args.get('profile') == '1': profile = g.profiler.save(request.endpoint or 'unmatched')
+    if LOG_REQUESTS or seconds * 1000 >= SLOW_REQUEST_MS or profile:
+        metrics.log("Request", method=request.method, route=route, status=response.status_code, ms=round(seconds * 1000, 1),
+                    sql_queries=g.sql_queries, sql_ms=round(g.sql_seconds * 1000, 1), **({"profile": profile} if profile else {}))
+    return response
+
+@app.teardown_request
+def stop_profiler(exc):
+    # after_request is skipped when a view raises
+    if g.get('profiler'): g.profiler.stop()
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Admins, or the scraper token; open to all only when METRICS_PUBLIC=1
+    scraper = METRICS_TOKEN and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}")
+    if not (METRICS_PUBLIC or scraper or session.get('is_admin')): return "forbidden", 403
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # --- Routes ---
 
@@ -120,12 +255,14 @@ def dashboard():
         # 2. Find batches assigned to these vehicles that are active
         vehicle_ids = [v.id for v in my_vehicles]
         # Drivers only care about 'Ready' (Waiting to start) or 'Transporting' (On the way)
-        my_missions = Batch.query.filter(
+        my_missions = Batch.query.options(joinedload(Batch.vehicle)).filter(
             Batch.vehicle_id.in_(vehicle_ids), 
             Batch.status.in_(['Ready', 'Transporting'])
         ).all()
+        # 3. Stop order for each mission
+        routes = batch_routes([m.id for m in my_missions])
             
-        return render_template("dashboard_driver.html", username=session['username'], vehicles=my_vehicles, missions=my_missions)
+        return render_template("dashboard_driver.html", username=session['username'], vehicles=my_vehicles, missions=my_missions, routes=routes)
 
 # --- Upload (Admin Only) ---
 @app.route("/upload", methods=["GET", "POST"])
@@ -135,66 +272,258 @@ def upload():
     if request.method == "POST":
         file = request.files.get('parcel_image')
         if file and file.filename:
-            filename = secure_filename(file.filename)
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(save_path)
-            try: results = analyze_parcel_image(save_path)
-            except: return redirect(request.url)
-            return render_template("confirm_upload.html", username=session['username'], image_filename=filename, ai_data=results)
+            try: filename = image_store.save(file.stream, file.filename)
+            except ValueError as e:
+                flash(str(e), 'error'); return redirect(request.url)
+            # Analysis runs on the worker pool so this request returns right away
+            try: job = jobs.submit(image_store.path_for(filename), filename)
+            except QueueFullError as e:
+                flash(str(e), 'error'); return redirect(request.url)
+            return redirect(url_for('upload_job', job_id=job.id))
 
     return render_template("upload.html", username=session['username'], batches=Batch.query.all())
 
+@app.route("/upload/job/<job_id>")
+def upload_job(job_id):
+    if not session.get('is_admin'): return redirect(url_for('dashboard'))
+    job = jobs.get(job_id)
+    if not job:
+        flash('Analysis job not found or expired.', 'error'); return redirect(url_for('upload'))
+    if job.status == 'failed':
+        flash(f'Analysis failed: {job.error}', 'error'); return redirect(url_for('upload'))
+    if job.status != 'done':
+        return render_template("upload_wait.html", username=session['username'], job=job, queue_depth=jobs.pending())
+    if job.kind == 'bulk':
+        items = [row for filename, result in zip(job.image_filename, job.result['results']) for row in detection_rows(filename, result)]
+        return render_template("confirm_bulk_upload.html", username=session['username'], items=items, stats=job.result['stats'])
+    items = detection_rows(job.image_filename, job.result)
+    # Several parcels in one photo: one row each, saved together like a bulk upload
+    if len(items) > 1:
+        return render_template("confirm_bulk_upload.html", username=session['username'], items=items, stats=None)
+    return render_template("confirm_upload.html", username=session['username'], image_filename=job.image_filename, ai_data=job.result)
+
+@app.route("/upload/job/<job_id>/status")
+def upload_job_status(job_id):
+    if not session.get('is_admin'): return jsonify({"error": "forbidden"}), 403
+    job = jobs.get(job_id)
+    if not job: return jsonify({"error": "not found"}), 404
+    return jsonify(dict(job.to_dict(), queue_depth=jobs.pending()))
+
+def detection_rows(filename, result):
+    # -> (filename, parcel, number, count) per detected parcel; results cached before
+    # multi-parcel detection have no "parcels" list and count as one
+    parcels = result.get('parcels') or [result]
+    return [(filename, parcel, n, len(parcels)) for n, parcel in enumerate(parcels, 1)]
+
+# --- Bulk Upload (Admin Only): many images, batched AI inference ---
+def save_bulk_images(files, zip_file):
+    # Each file / zip member is streamed into the image store, never read whole into memory.
+    # One bad file is skipped (with a note), it doesn't sink the whole upload.
+    saved = []
+    def keep(stream, filename):
+        try: saved.append(image_store.save(stream, filename))
+        except ValueError as e: flash(f'Skipped {filename}: {e}', 'warning')
+    for f in files:
+        if f and image_store.is_image_name(f.filename):
+            keep(f.stream, f.filename)
+    if zip_file and zip_file.filename:
+        with zipfile.ZipFile(zip_file.stream) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not image_store.is_image_name(member.filename): continue
+                with archive.open(member) as src:
+                    keep(src, member.filename)
+    return saved
+
+@app.route("/upload/bulk", methods=["POST"])
+def upload_bulk():
+    if not session.get('is_admin'): return redirect(url_for('dashboard'))
+    try:
+        filenames = save_bulk_images(request.files.getlist('parcel_images'), request.files.get('parcel_zip'))
+    except zipfile.BadZipFile:
+        flash('Invalid zip file.', 'error'); return redirect(url_for('upload'))
+    if not filenames:
+        flash('No images found in upload.', 'error'); return redirect(url_for('upload'))
+    # The whole set is one job on the worker pool; same waiting page as a single upload
+    try: job = jobs.submit([image_store.path_for(f) for f in filenames], filenames, kind='bulk')
+    except QueueFullError as e:
+        flash(str(e), 'error'); return redirect(url_for('upload'))
+    return redirect(url_for('upload_job', job_id=job.id))
+
+# --- AI bounding-box image (drawn on first request from the saved boxes) ---
+@app.route("/uploads/<filename>/predicted")
+def predicted_image(filename):
+    if 'username' not in session: return redirect(url_for('login'))
+    image_path = image_store.path_for(filename)
+    if not image_path or not os.path.exists(image_path): return "Image not found", 404
+    # Fall back to the preview when there are no boxes to draw
+    return send_file(ensure_predicted_image(image_path) or image_store.variant(filename, 'preview') or image_path)
+
+# --- Parcel photos: WebP thumb / preview, or the original ---
+@app.route("/media/<key>/<size>")
+def media(key, size):
+    if 'username' not in session: return redirect(url_for('login'))
+    path = image_store.path_for(key) if size == 'original' else image_store.variant(key, size)
+    if not path or not os.path.exists(path): return "Image not found", 404
+    # A key always means the same photo, so browsers can keep it for good
+    response = send_file(path, max_age=image_store.CACHE_SECONDS)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/ai/cache_stats")
+def ai_cache_stats():
+    if not session.get('is_admin'): return jsonify({"error": "forbidden"}), 403
+    if not result_cache: return jsonify({"enabled": False})
+    return jsonify(dict(result_cache.stats(), enabled=True))
+
+def batch_type_for_volume(real_volume):
+    if real_volume < 0.01: return 'small'
+    elif real_volume < 0.05: return 'medium'
+    else: return 'large'
+
+AUTO_MAX_VOLUME = {'small': 0.5, 'medium': 2.0, 'large': 5.0}
+
+def auto_batch_name(batch_type):
+    # The seconds alone collide when several admins confirm at the same time
+    ts = datetime.datetime.now().strftime("%H%M%S")
+    return f"Auto-{ts}-{uuid.uuid4().hex[:4]} ({batch_type})"
+
+def open_auto_batch(batch_type, max_volume, current_volume=0.0, status='In Progress'):
+    batch = Batch(batch_name=auto_batch_name(batch_type), batch_type=batch_type, max_volume=max_volume, current_volume=current_volume, status=status, vehicle_id=None)
+    db.session.add(batch); db.session.flush()
+    bump_stat('batches_type', batch_type)
+    return batch
+
+OPEN_BATCH = aliased(Batch) # built once so the allocation statement stays in SQLAlchemy's compiled cache
+
+def allocate_batch(batch_type, volume):
+    # Put `volume` into the oldest open batch of this type with one UPDATE, so
+    # concurrent confirmations can't lose increments or overfill a batch.
+    # The UPDATE also takes SQLite's write lock first, which serialises the rest
+    # of this transaction (including opening a new batch).
+    # Returns (id, name, notes, fill); fill = (current_volume, max_volume, max_capacity) while the batch stays open.
+    notes = []
+    for attempt in range(3):
+        target = db.session.query(OPEN_BATCH.id).filter(OPEN_BATCH.status == 'In Progress', OPEN_BATCH.batch_type == batch_type).order_by(OPEN_BATCH.id).limit(1).scalar_subquery()
+        becomes_full = (Batch.current_volume + volume) / Batch.max_volume * 100 >= Batch.max_capacity
+        stmt = (update(Batch).where(Batch.id == target, Batch.status == 'In Progress')
+                .values(current_volume=Batch.current_volume + volume, status=case((becomes_full, 'Full'), else_=Batch.status))
+                .returning(Batch.id, Batch.batch_name, Batch.status, Batch.current_volume, Batch.max_volume, Batch.max_capacity))
+        row = db.session.execute(stmt, execution_options={"synchronize_session": False}).first()
+        if row: break
+        # Lost a race for the last open batch? Try again before opening a new one
+        if not Batch.query.filter_by(status='In Progress', batch_type=batch_type).first(): break
+
+    if not row:
+        max_volume = AUTO_MAX_VOLUME[batch_type]
+        status = 'Full' if volume / max_volume * 100 >= Batch.max_capacity.default.arg else 'In Progress'
+        batch = open_auto_batch(batch_type, max_volume, volume, status)
+        notes.append((f'New Batch Created: {batch.batch_name}', 'info'))
+        row = (batch.id, batch.batch_name, batch.status, batch.current_volume, batch.max_volume, Batch.max_capacity.default.arg)
+
+    batch_id, batch_name, status, current_volume, max_volume, max_capacity = row
+    # Check Full
+    if status == 'Full':
+        next_batch = open_auto_batch(batch_type, max_volume)
+        notes.append((f'Batch Full! Auto-created next batch: {next_batch.batch_name}', 'warning'))
+        return batch_id, batch_name, notes, None
+    return batch_id, batch_name, notes, (current_volume, max_volume, max_capacity)
+
+def allocate_batches(batch_type, volumes):
+    # Bulk allocate_batch: after each allocation, the run of following parcels that keeps
+    # the batch below its Full mark goes in with one more UPDATE instead of one each.
+    # Safe because that batch row stays write-locked until this transaction ends.
+    placed, notes, i = [], [], 0
+    while i < len(volumes):
+        batch_id, batch_name, batch_notes, fill = allocate_batch(batch_type, volumes[i])
+        placed.append((batch_id, batch_name)); notes.extend(batch_notes); i += 1
+        if not fill: continue
+        current_volume, max_volume, max_capacity = fill
+        added = 0.0
+        start = i
+        while i < len(volumes) and (current_volume + added + volumes[i]) / max_volume * 100 < max_capacity:
+            added += volumes[i]; i += 1
+        if i > start:
+            db.session.execute(update(Batch).where(Batch.id == batch_id).values(current_volume=Batch.current_volume + added), execution_options={"synchronize_session": False})
+            placed.extend([(batch_id, batch_name)] * (i - start))
+    return placed, notes
+
+def place_parcel(filename, external_id, address_input, dimensions, weight, real_volume, commit=True):
+    batch_id, batch_name, notes, _ = allocate_batch(batch_type_for_volume(real_volume), real_volume)
+
+    new_parcel = Parcel(parcel_name=filename, external_parcel_id=external_id, delivery_address=address_input, dimensions=dimensions, weight=weight, estimated_volume=real_volume, user_id=session['user_id'], batch_id=batch_id)
+    db.session.add(new_parcel)
+    bump_parcel_stats({datetime.datetime.utcnow().date().isoformat(): 1})
+
+    if commit:
+        db.session.commit(); forget_counts()
+    # Only tell the user once the change is really saved
+    for message, category in notes: flash(message, category)
+    return batch_name
+
 @app.route("/confirm_parcel", methods=["POST"])
 def confirm_parcel():
     if not session.get('is_admin'): return redirect(url_for('login'))
     try:
-        filename = request.form['image_filename']
-        external_id = request.form['external_parcel_id']
-        address_input = request.form.get('delivery_address')
-        dimensions = request.form['dimensions']
-        weight = float(request.form['weight'])
-        real_volume = float(request.form['estimated_volume'])
-        
-        required_batch_type = 'small'
-        if real_volume < 0.01: 
-            required_batch_type = 'small'
-        elif real_volume < 0.05: 
-            required_batch_type = 'medium'
-        else: 
-            required_batch_type = 'large'
-        
-        target_batch = Batch.query.filter_by(status='In Progress', batch_type=required_batch_type).first()
-        
-        if not target_batch:
-            ts = datetime.datetime.now().strftime("%H%M%S")
-            auto_name = f"Auto-{ts} ({required_batch_type})"
-            default_max_vol = 2.0 
-            if required_batch_type == 'small': default_max_vol = 0.5
-            elif required_batch_type == 'large': default_max_vol = 5.0
-            
-            target_batch = Batch(batch_name=auto_name, batch_type=required_batch_type, max_volume=default_max_vol, status='In Progress', vehicle_id=None)
-            db.session.add(target_batch); db.session.commit()
-            flash(f'New Batch Created: {auto_name}', 'info')
-        
-        new_parcel = Parcel(parcel_name=filename, external_parcel_id=external_id, delivery_address=address_input, dimensions=dimensions, weight=weight, estimated_volume=real_volume, user_id=session['user_id'], batch_id=target_batch.id)
-        db.session.add(new_parcel)
-        
-        target_batch.current_volume += real_volume
-        # Check Full
-        if (target_batch.current_volume / target_batch.max_volume) * 100 >= target_batch.max_capacity:
-            target_batch.status = 'Full'
-            ts = datetime.datetime.now().strftime("%H%M%S")
-            new_auto_name = f"Auto-{ts} ({required_batch_type})"
-            new_batch = Batch(batch_name=new_auto_name, batch_type=required_batch_type, max_volume=target_batch.max_volume, status='In Progress', vehicle_id=None)
-            db.session.add(new_batch)
-            flash(f'Batch Full! Auto-created next batch: {new_auto_name}', 'warning')
-
-        db.session.commit()
-        flash(f'Saved to {target_batch.batch_name}.', 'success')
+        batch_name = place_parcel(request.form['image_filename'], request.form['external_parcel_id'], request.form.get('delivery_address'),
+                                  request.form['dimensions'], float(request.form['weight']), float(request.form['estimated_volume']))
+        flash(f'Saved to {batch_name}.', 'success')
         return redirect(url_for('upload'))
     except Exception as e:
         db.session.rollback(); flash(f'Error: {e}', 'error'); return redirect(url_for('upload'))
 
+def insert_ids(model, rows):
+    # Batched multi-row INSERTs; returns the new ids in the order of `rows`
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite has no ordering sentinel (sort_by_parameter_order would fall back to one INSERT
+        # per row). It numbers rows max(id)+1 in VALUES order, and this transaction holds the write
+        # lock from its first INSERT, so the ids are one increasing run: sorted = row order.
+        return sorted(db.session.scalars(db.insert(model).returning(model.id), rows).all())
+    # PostgreSQL orders by the SERIAL/IDENTITY key inside each batched INSERT ... SELECT
+    return db.session.scalars(db.insert(model).returning(model.id, sort_by_parameter_order=True), rows).all()
+
+def place_parcels(rows, user_id):
+    # Many parcels in the caller's transaction: allocated per type in runs, then one multi-row INSERT
+    if not rows: return [], [], []
+    by_type = {}
+    for i, row in enumerate(rows): by_type.setdefault(batch_type_for_volume(row['estimated_volume']), []).append(i)
+    batches, notes = [None] * len(rows), []
+    for batch_type, indexes in by_type.items():
+        placed, type_notes = allocate_batches(batch_type, [rows[i]['estimated_volume'] for i in indexes])
+        for i, batch in zip(indexes, placed): batches[i] = batch
+        notes.extend(type_notes)
+    values = [dict(row, user_id=user_id, batch_id=batch[0]) for row, batch in zip(rows, batches)]
+    ids = insert_ids(Parcel, values)
+    bump_parcel_stats({datetime.datetime.utcnow().date().isoformat(): len(values)})
+    return ids, [batch[1] for batch in batches], notes
+
+@app.route("/confirm_bulk", methods=["POST"])
+def confirm_bulk():
+    if not session.get('is_admin'): return redirect(url_for('login'))
+    f = request.form
+    included = set(f.getlist('include'))
+    # A row with a bad number is left out (with a note), it doesn't sink the rest
+    rows = []
+    for i, filename in enumerate(f.getlist('image_filename')):
+        if str(i) not in included: continue
+        try:
+            weight, volume = float(f.getlist('weight')[i]), float(f.getlist('estimated_volume')[i])
+            if not (weight >= 0 and volume >= 0): raise ValueError # also catches nan
+        except ValueError:
+            flash(f'Row {i + 1} ({image_store.label(filename)}) not saved: weight and volume must be numbers of 0 or more.', 'error'); continue
+        rows.append({"parcel_name": filename, "external_parcel_id": f.getlist('external_parcel_id')[i], "delivery_address": f.getlist('delivery_address')[i],
+                     "dimensions": f.getlist('dimensions')[i], "weight": weight, "estimated_volume": volume})
+    try:
+        ids, _, notes = place_parcels(rows, session['user_id'])
+        # The whole set goes in as one transaction
+        db.session.commit(); forget_counts()
+        for message, category in notes: flash(message, category)
+        flash(f'Saved {len(ids)} parcels.', 'success')
+    except Exception as e:
+        db.session.rollback(); flash(f'Error, nothing saved: {e}', 'error')
+    return redirect(url_for('upload'))
+
 # --- Assign Vehicle (Modified) ---
 @app.route("/batch/<int:batch_id>/assign", methods=["POST"])
 def assign_vehicle(batch_id):
@@ -209,10 +538,15 @@ def assign_vehicle(batch_id):
     else:
         flash(f'Vehicle {vehicle.vehicle_uid} assigned.', 'success')
 
+    previous = batch.vehicle_id
+    if batch.vehicle: bump_stat('vehicle_batches', batch.vehicle.vehicle_type, -1)
+    bump_stat('vehicle_batches', vehicle.vehicle_type)
     batch.vehicle_id = vehicle.id
     batch.max_volume = vehicle.capacity_m3
-    # UPDATE: Don't set to Transporting yet. Set to 'Reserved'.
-    vehicle.status = 'Reserved' 
+    # Reserved until the driver starts (see batch_states.VEHICLE_STATUS)
+    vehicle.status = batch_states.VEHICLE_STATUS[batch.status]
+    if previous and previous != vehicle.id:
+        db.session.flush(); lifecycle.release(db.session, [previous])
     db.session.commit()
     return redirect(url_for('batch_detail', batch_id=batch.id))
 
@@ -224,8 +558,10 @@ def batch_dispatch(batch_id):
     if not batch.vehicle: return redirect(url_for('batch_detail', batch_id=batch.id))
 
     load_percent = (batch.current_volume / batch.max_volume) * 100
-    
-    batch.status = 'Ready'
+
+    if not lifecycle.transition(db.session, [batch.id], 'Ready'):
+        flash(f'A batch that is {batch.status} cannot be dispatched.', 'error')
+        return redirect(url_for('batch_detail', batch_id=batch.id))
     db.session.commit()
     
     if load_percent < 70:
@@ -235,18 +571,99 @@ def batch_dispatch(batch_id):
         
     return redirect(url_for('batch_list'))
 
+# --- Consolidation Plan (Admin): repack open parcels into the Available vehicles ---
+def plan_inputs():
+    # Unbatched parcels + parcels in open batches that have no vehicle yet
+    open_batches = db.session.query(Batch.id).filter(Batch.status.in_(batch_states.OPEN), Batch.vehicle_id.is_(None))
+    rows = db.session.query(Parcel.id, Parcel.estimated_volume, Parcel.delivery_address).filter(or_(Parcel.batch_id.is_(None), Parcel.batch_id.in_(open_batches))).order_by(Parcel.id).all()
+    parcel_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    volumes = np.array([r[1] or 0.0 for r in rows], dtype=np.float64)
+    zones = address_zones([r[2] for r in rows])
+    vehicles = Vehicle.query.filter_by(status='Available').order_by(Vehicle.id).all()
+    capacities = np.array([v.capacity_m3 for v in vehicles], dtype=np.float64)
+    # Changes whenever a parcel, volume, address or vehicle changes, so Apply can tell the preview is stale
+    digest = hashlib.sha1(parcel_ids.tobytes() + volumes.tobytes() + zones.tobytes() + capacities.tobytes() + str([v.id for v in vehicles]).encode())
+    return parcel_ids, volumes, zones, vehicles, capacities, digest.hexdigest()
+
+def address_zones(addresses):
+    # Route rank of each address's delivery zone (zones nearest the depot first, unknown last)
+    located = route_planner.geocoder.locate_many(addresses)
+    rank = {z: i for i, z in enumerate(route_planner.order_zones(route_planner.zone_centroids(located.values())))}
+    by_address = {a: rank[hit[2] if hit else route_planner.UNKNOWN_ZONE] for a, hit in located.items()}
+    return np.array([by_address[a] for a in addresses], dtype=np.int64)
+
+def apply_plan(parcel_ids, vehicles, result):
+    source_ids = [r[0] for r in db.session.query(Batch.id).filter(Batch.status.in_(batch_states.OPEN), Batch.vehicle_id.is_(None))]
+    moves = []
+    for load in result['vehicles']:
+        vehicle = vehicles[load['vehicle']]
+        ts = datetime.datetime.now().strftime("%H%M%S")
+        batch = Batch(batch_name=f"Plan-{ts}-{uuid.uuid4().hex[:4]} ({vehicle.vehicle_uid})", batch_type='mixed', max_volume=vehicle.capacity_m3,
+                      current_volume=load['load'], status='In Progress', vehicle_id=vehicle.id)
+        db.session.add(batch); db.session.flush()
+        # Same as assign_vehicle: reserved until the driver starts
+        vehicle.status = batch_states.VEHICLE_STATUS[batch.status]
+        bump_stat('batches_type', 'mixed')
+        bump_stat('vehicle_batches', vehicle.vehicle_type)
+        moves.extend({"id": int(pid), "batch_id": batch.id} for pid in parcel_ids[load['items']])
+    if moves: db.session.execute(update(Parcel), moves)
+
+    if source_ids:
+        # Whatever did not fit stays where it was; recount the old batches and drop the empty ones
+        remaining = db.session.query(func.coalesce(func.sum(Parcel.estimated_volume), 0.0)).filter(Parcel.batch_id == Batch.id).scalar_subquery()
+        db.session.execute(update(Batch).where(Batch.id.in_(source_ids)).values(current_volume=remaining), execution_options={"synchronize_session": False})
+        has_parcels = db.session.query(Parcel.id).filter(Parcel.batch_id == Batch.id).exists()
+        empty = Batch.query.filter(Batch.id.in_(source_ids), ~has_parcels)
+        for btype, n in empty.with_entities(Batch.batch_type, func.count(Batch.id)).group_by(Batch.batch_type):
+            bump_stat('batches_type', btype, -n)
+        empty.delete(synchronize_session=False)
+        still_full = Batch.current_volume / Batch.max_volume * 100 >= Batch.max_capacity
+        db.session.execute(update(Batch).where(Batch.id.in_(source_ids)).values(status=case((still_full, 'Full'), else_='In Progress')), execution_options={"synchronize_session": False})
+    db.session.commit(); forget_counts()
+
+@app.route("/batch/plan")
+def batch_plan():
+    if not session.get('is_admin'): return redirect(url_for('login'))
+    parcel_ids, volumes, zones, vehicles, capacities, signature = plan_inputs()
+    result = batch_planner.plan(volumes, capacities, zones=zones)
+    metrics.log("Planner", parcels=len(volumes), zones=result['zones'], vehicles_used=result['vehicles_used'], vehicles=len(vehicles),
+                strategy=result['strategy'], ms=round(result['seconds'] * 1000, 1))
+    return render_template("batch_plan.html", username=session['username'], plan=result, vehicles=vehicles, signature=signature,
+                           low_load=batch_planner.LOW_LOAD_PERCENT)
+
+@app.route("/batch/plan/apply", methods=["POST"])
+def batch_plan_apply():
+    if not session.get('is_admin'): return redirect(url_for('login'))
+    parcel_ids, volumes, zones, vehicles, capacities, signature = plan_inputs()
+    # Parcels or vehicles changed since the preview: show the new plan instead of applying a different one blind
+    if request.form.get('signature') != signature:
+        flash('Parcels or vehicles changed since the preview. Please review the updated plan.', 'warning')
+        return redirect(url_for('batch_plan'))
+    result = batch_planner.plan(volumes, capacities, zones=zones)
+    if not result['vehicles']:
+        flash('Nothing to plan.', 'warning'); return redirect(url_for('batch_plan'))
+    try:
+        apply_plan(parcel_ids, vehicles, result)
+        flash(f"Plan applied: {result['parcel_count'] - len(result['unplaced'])} parcels in {result['vehicles_used']} vehicles ({result['average_load_percent']}% average load).", 'success')
+    except Exception as e:
+        db.session.rollback(); flash(f'Error: {e}', 'error')
+    return redirect(url_for('batch_list'))
+
 # --- Driver Actions (Interaction) ---
+def drives(batch):
+    # The logged-in driver is the one on the batch's vehicle (same match as the driver dashboard)
+    driver = batch.vehicle.driver_name if batch.vehicle else None
+    return bool(driver) and driver.lower() == session.get('username', '').lower()
 
 @app.route("/driver/start/<int:batch_id>", methods=["POST"])
 def driver_start_mission(batch_id):
     if session.get('is_admin'): return redirect(url_for('dashboard')) # Only Driver
     batch = Batch.query.get_or_404(batch_id)
+    if not drives(batch): flash('This mission is not yours.', 'error'); return redirect(url_for('dashboard'))
     
-    # Logic: Start the engine
-    batch.status = 'Transporting'
-    if batch.vehicle:
-        batch.vehicle.status = 'Transporting'
-    
+    # Logic: Start the engine (the vehicle goes Transporting with it)
+    if not lifecycle.transition(db.session, [batch.id], 'Transporting'):
+        flash('This mission is not ready to start.', 'error'); return redirect(url_for('dashboard'))
     db.session.commit()
     flash('Mission Started! Drive safely.', 'success')
     return redirect(url_for('dashboard'))
@@ -255,26 +672,105 @@ def driver_start_mission(batch_id):
 def driver_complete_mission(batch_id):
     if session.get('is_admin'): return redirect(url_for('dashboard'))
     batch = Batch.query.get_or_404(batch_id)
+    if not drives(batch): flash('This mission is not yours.', 'error'); return redirect(url_for('dashboard'))
     
-    # Logic: Arrived
-    batch.status = 'Completed'
-    batch.completion_time = datetime.datetime.now()
-    if batch.vehicle:
-        batch.vehicle.status = 'Available' # Free up the vehicle
-    
+    # Logic: Arrived, which frees up the vehicle
+    if not lifecycle.transition(db.session, [batch.id], 'Completed'):
+        flash('This mission is already completed.', 'error'); return redirect(url_for('dashboard'))
     db.session.commit()
     flash('Mission Completed! Good job.', 'success')
     return redirect(url_for('dashboard'))
 
+# --- Pagination (keyset on id, newest first) ---
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+MAX_PAGE_SIZE = 500
+COUNT_TTL = 30 # seconds a total count may be reused
+_count_cache = {}
+
+def cached_count(key, query):
+    # Counting a big table on every page view is a full scan, so reuse it for a while
+    hit = _count_cache.get(key)
+    if hit and time.time() - hit[1] < COUNT_TTL: return hit[0]
+    if len(_count_cache) > 256: _count_cache.clear()
+    total = query.order_by(None).count()
+    _count_cache[key] = (total, time.time())
+    return total
+
+def forget_counts():
+    _count_cache.clear()
+
+def keyset_page(query, id_col, count_key):
+    total = cached_count(count_key, query)
+    per_page = min(max(request.args.get('per_page', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    after, before = request.args.get('after', type=int), request.args.get('before', type=int)
+    if before:
+        # Going back: walk upwards from the first id of the current page
+        rows = query.filter(id_col > before).order_by(id_col.asc()).limit(per_page + 1).all()
+        has_prev, rows = len(rows) > per_page, rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after: query = query.filter(id_col < after)
+        rows = query.order_by(id_col.desc()).limit(per_page + 1).all()
+        has_next, rows = len(rows) > per_page, rows[:per_page]
+        has_prev = after is not None
+    return {
+        "items": rows,
+        "per_page": per_page,
+        "next": rows[-1].id if rows and has_next else None,
+        "prev": rows[0].id if rows and has_prev else None,
+        "total": total,
+    }
+
+def batch_routes(batch_ids):
+    # Delivery order per batch from one GROUP BY on (batch, address); routes are cached per stop set
+    stops = {}
+    if batch_ids:
+        rows = db.session.query(Parcel.batch_id, Parcel.delivery_address, func.count(Parcel.id)).filter(Parcel.batch_id.in_(batch_ids)).group_by(Parcel.batch_id, Parcel.delivery_address)
+        for batch_id, address, n in rows: stops.setdefault(batch_id, []).append((address, n))
+    return {batch_id: route_planner.plan_route(stops.get(batch_id, [])) for batch_id in batch_ids}
+
+def parcel_counts(batch_ids):
+    # One GROUP BY instead of loading batch.parcels for every row
+    if not batch_ids: return {}
+    rows = db.session.query(Parcel.batch_id, func.count(Parcel.id)).filter(Parcel.batch_id.in_(batch_ids)).group_by(Parcel.batch_id)
+    return dict(rows.all())
+
+# --- Search (FTS5 trigram index, with indexed fast paths for parcel IDs) ---
+ID_PREFIX = re.compile(r'(SPX|P-)[A-Z0-9-]*|\d{4,}', re.IGNORECASE)
+
+def id_range(col, prefix):
+    # "starts with" written as a range so SQLite can walk the B-tree index
+    return and_(col >= prefix, col < prefix + '\uffff')
+
+def search_filter(table, model, columns, term):
+    if search_index.can_match(term): return model.id.in_(search_index.match_ids(table, term))
+    return or_(*[c.ilike(f"%{term}%") for c in columns])
+
+def parcel_search_filter(term):
+    # A term shaped like a parcel ID is an ID lookup (what scanning or typing a label wants):
+    # it matches IDs only, so parcel names and IDs merely containing the term are not listed.
+    # Only when no ID matches does it fall back to the substring search over ID and name.
+    term = term.strip()
+    # A full scanned ID -> exact match on the external_parcel_id index
+    if ID_PATTERN.fullmatch(term):
+        exact = Parcel.external_parcel_id == term.upper()
+        if db.session.query(Parcel.id).filter(exact).first(): return exact
+    # The start of an ID -> indexed prefix range (IDs are stored upper-case)
+    if ID_PREFIX.fullmatch(term):
+        prefix = id_range(Parcel.external_parcel_id, term.upper())
+        if db.session.query(Parcel.id).filter(prefix).first(): return prefix
+    return search_filter('parcel', Parcel, [Parcel.external_parcel_id, Parcel.parcel_name], term)
+
 # --- Management Routes ---
 
 @app.route("/parcel_list")
 def parcel_list():
     if 'username' not in session: return redirect(url_for('login'))
     search = request.args.get('search_query')
-    query = Parcel.query
-    if search: query = query.filter(or_(Parcel.external_parcel_id.ilike(f"%{search}%"), Parcel.parcel_name.ilike(f"%{search}%")))
-    return render_template("parcel_list.html", username=session['username'], parcels=query.order_by(Parcel.id.desc()).all(), search_query=search)
+    query = Parcel.query.options(joinedload(Parcel.batch))
+    if search: query = query.filter(parcel_search_filter(search))
+    page = keyset_page(query, Parcel.id, ('parcel', search))
+    return render_template("parcel_list.html", username=session['username'], parcels=page['items'], page=page, search_query=search)
 
 @app.route("/parcel/<int:parcel_id>")
 def parcel_detail(parcel_id):
@@ -286,11 +782,13 @@ def parcel_bulk_delete():
     if not session.get('is_admin'): return redirect(url_for('dashboard'))
     ids = request.form.getlist("parcel_ids")
     if ids:
-        parcels = Parcel.query.filter(Parcel.id.in_(ids)).all()
-        for p in parcels:
-            if p.batch and p.batch.status != 'Completed': p.batch.current_volume -= p.estimated_volume
+        # Give the volume back to open batches with a SQL-side decrement per batch
+        for batch_id, volume in db.session.query(Parcel.batch_id, func.sum(Parcel.estimated_volume)).filter(Parcel.id.in_(ids), Parcel.batch_id.isnot(None)).group_by(Parcel.batch_id):
+            db.session.execute(update(Batch).where(Batch.id == batch_id, Batch.status != 'Completed').values(current_volume=Batch.current_volume - volume), execution_options={"synchronize_session": False})
+        day = func.date(Parcel.created_time)
+        bump_parcel_stats({str(d): n for d, n in db.session.query(day, func.count(Parcel.id)).filter(Parcel.id.in_(ids)).group_by(day) if d is not None}, -1)
         db.session.query(Parcel).filter(Parcel.id.in_(ids)).delete(synchronize_session=False)
-        db.session.commit()
+        db.session.commit(); forget_counts()
         flash('Deleted.', 'success')
     return redirect(url_for('parcel_list'))
 
@@ -298,9 +796,11 @@ def parcel_bulk_delete():
 def batch_list():
     if 'username' not in session: return redirect(url_for('login'))
     search = request.args.get('search_query')
-    query = Batch.query
-    if search: query = query.filter(Batch.batch_name.ilike(f"%{search}%"))
-    return render_template("batch_list.html", username=session['username'], batches=query.order_by(Batch.id.desc()).all(), search_query=search)
+    query = Batch.query.options(joinedload(Batch.vehicle))
+    if search: query = query.filter(search_filter('batch', Batch, [Batch.batch_name], search.strip()))
+    page = keyset_page(query, Batch.id, ('batch', search))
+    counts = parcel_counts([b.id for b in page['items']])
+    return render_template("batch_list.html", username=session['username'], batches=page['items'], page=page, parcel_counts=counts, search_query=search)
 
 @app.route("/batch/create", methods=["GET", "POST"])
 def create_batch():
@@ -312,18 +812,23 @@ def create_batch():
             if Batch.query.filter_by(batch_name=full).first(): flash('Exists.', 'error'); return redirect(url_for('create_batch'))
             if vid:
                 veh = Vehicle.query.get(vid)
-                mv, v_id, veh.status = veh.capacity_m3, veh.id, 'Transporting'
+                mv, v_id, veh.status = veh.capacity_m3, veh.id, batch_states.VEHICLE_STATUS['In Progress']
             else:
                 v_id, mv = None, (0.5 if btype=='small' else (2.0 if btype=='medium' else 5.0))
             db.session.add(Batch(batch_name=full, batch_type=btype, max_volume=mv, status='In Progress', vehicle_id=v_id))
-            db.session.commit(); flash('Created.', 'success'); return redirect(url_for('batch_list'))
+            bump_stat('batches_type', btype)
+            if vid: bump_stat('vehicle_batches', veh.vehicle_type)
+            db.session.commit(); forget_counts(); flash('Created.', 'success'); return redirect(url_for('batch_list'))
         except Exception as e: db.session.rollback(); flash(f'Error: {e}', 'error')
     return render_template("create_batch.html", username=session['username'], vehicles=Vehicle.query.filter_by(status='Available').all())
 
 @app.route("/batch/<int:batch_id>")
 def batch_detail(batch_id):
     if 'username' not in session: return redirect(url_for('login'))
-    return render_template("batch_detail.html", username=session['username'], batch=Batch.query.get_or_404(batch_id), vehicles=Vehicle.query.filter_by(status='Available').all())
+    batch = Batch.query.options(joinedload(Batch.vehicle)).filter_by(id=batch_id).first_or_404()
+    route = batch_routes([batch.id])[batch.id]
+    parcel_count = sum(stop['parcels'] for stop in route['stops'])
+    return render_template("batch_detail.html", username=session['username'], batch=batch, parcel_count=parcel_count, route=route, vehicles=Vehicle.query.filter_by(status='Available').all())
 
 @app.route("/batch/<int:batch_id>/edit", methods=["GET", "POST"])
 def batch_edit(batch_id):
@@ -332,42 +837,54 @@ def batch_edit(batch_id):
     if request.method == "POST":
         try:
             batch.batch_name, batch.max_volume = request.form['batch_name'], float(request.form['max_volume'])
-            nid = request.form['vehicle_id']
+            nid, previous = request.form['vehicle_id'], batch.vehicle_id
             if nid == "none":
-                if batch.vehicle: batch.vehicle.status = 'Available'
+                if batch.vehicle: bump_stat('vehicle_batches', batch.vehicle.vehicle_type, -1)
                 batch.vehicle_id = None
             elif batch.vehicle_id != int(nid):
-                if batch.vehicle: batch.vehicle.status = 'Available'
-                nv = Vehicle.query.get(int(nid)); nv.status = 'Transporting'; batch.vehicle_id = nv.id
+                if batch.vehicle: bump_stat('vehicle_batches', batch.vehicle.vehicle_type, -1)
+                nv = Vehicle.query.get(int(nid)); nv.status = batch_states.VEHICLE_STATUS[batch.status]; batch.vehicle_id = nv.id
+                bump_stat('vehicle_batches', nv.vehicle_type)
+            if previous and previous != batch.vehicle_id:
+                db.session.flush(); lifecycle.release(db.session, [previous])
             db.session.commit(); flash('Updated.', 'success'); return redirect(url_for('batch_list'))
         except: db.session.rollback(); flash('Update failed.', 'error')
     return render_template("batch_edit.html", username=session['username'], batch=batch, vehicles=Vehicle.query.filter((Vehicle.status == 'Available') | (Vehicle.id == batch.vehicle_id)).all())
 
 @app.route("/batch/<int:batch_id>/finalize", methods=["POST"])
 def batch_finalize_single(batch_id):
+    if 'username' not in session: return redirect(url_for('login'))
     b = Batch.query.get_or_404(batch_id)
-    b.status, b.completion_time = 'Completed', datetime.datetime.now()
-    if b.vehicle: b.vehicle.status = 'Available'
+    if not session.get('is_admin') and not drives(b): return redirect(url_for('dashboard'))
+    if not lifecycle.transition(db.session, [b.id], 'Completed'):
+        flash(f'A batch that is {b.status} cannot be finalized.', 'error')
+        return redirect(url_for('batch_detail', batch_id=b.id))
     db.session.commit()
     return redirect(url_for('batch_completion_show', batch_id=b.id))
 
 @app.route("/batch/bulk_finalize", methods=["POST"])
 def batch_bulk_finalize():
+    if not session.get('is_admin'): return redirect(url_for('batch_list'))
     ids = request.form.getlist("batch_ids")
     if not ids: return redirect(url_for('batch_list'))
-    for b in Batch.query.filter(Batch.id.in_(ids), Batch.status=='Full').all():
-        b.status, b.completion_time = 'Completed', datetime.datetime.now()
-        if b.vehicle: b.vehicle.status = 'Available'
-    db.session.commit(); flash('Finalized.', 'success'); return redirect(url_for('batch_list'))
+    # One UPDATE for the batches, one for their vehicles, however many are ticked
+    done = lifecycle.transition(db.session, [int(i) for i in ids], 'Completed', sources=['Full'])
+    db.session.commit(); flash(f'Finalized {len(done)} batches.', 'success'); return redirect(url_for('batch_list'))
 
 @app.route("/batch/bulk_delete", methods=["POST"])
 def batch_bulk_delete():
     if not session.get('is_admin'): return redirect(url_for('batch_list'))
     ids = request.form.getlist("batch_ids")
     if ids:
+        day = func.date(Parcel.created_time)
+        bump_parcel_stats({str(d): n for d, n in db.session.query(day, func.count(Parcel.id)).filter(Parcel.batch_id.in_(ids)).group_by(day) if d is not None}, -1)
+        for btype, n in db.session.query(Batch.batch_type, func.count(Batch.id)).filter(Batch.id.in_(ids)).group_by(Batch.batch_type):
+            bump_stat('batches_type', btype, -n)
+        for vtype, n in db.session.query(Vehicle.vehicle_type, func.count(Batch.id)).join(Batch, Batch.vehicle_id == Vehicle.id).filter(Batch.id.in_(ids)).group_by(Vehicle.vehicle_type):
+            bump_stat('vehicle_batches', vtype, -n)
         Parcel.query.filter(Parcel.batch_id.in_(ids)).delete(synchronize_session=False)
         Batch.query.filter(Batch.id.in_(ids)).delete(synchronize_session=False)
-        db.session.commit(); flash('Deleted.', 'success')
+        db.session.commit(); forget_counts(); flash('Deleted.', 'success')
     return redirect(url_for('batch_list'))
 
 @app.route("/batch/<int:batch_id>/parcels")
@@ -378,7 +895,8 @@ def batch_parcel_list(batch_id):
 @app.route("/batch_completion/<int:batch_id>")
 def batch_completion_show(batch_id):
     if 'username' not in session: return redirect(url_for('login'))
-    return render_template("batch_completion.html", username=session['username'], batch=Batch.query.get_or_404(batch_id))
+    batch = Batch.query.options(joinedload(Batch.vehicle)).filter_by(id=batch_id).first_or_404()
+    return render_template("batch_completion.html", username=session['username'], batch=batch, parcel_count=parcel_counts([batch.id]).get(batch.id, 0))
 
 # --- Vehicle (Admin) ---
 @app.route("/vehicle_list")
@@ -386,7 +904,7 @@ def vehicle_list():
     if not session.get('is_admin'): return redirect(url_for('dashboard'))
     search = request.args.get('search_query')
     query = Vehicle.query
-    if search: query = query.filter(or_(Vehicle.plate_number.ilike(f"%{search}%"), Vehicle.driver_name.ilike(f"%{search}%")))
+    if search: query = query.filter(search_filter('vehicle', Vehicle, [Vehicle.plate_number, Vehicle.driver_name], search.strip()))
     return render_template("vehicle_list.html", username=session['username'], vehicles=query.order_by(Vehicle.id.asc()).all(), search_query=search)
 
 @app.route("/vehicle/add", methods=["GET", "POST"])
@@ -405,6 +923,10 @@ def vehicle_edit(vehicle_id):
     if not session.get('is_admin'): return redirect(url_for('dashboard'))
     v = Vehicle.query.get_or_404(vehicle_id)
     if request.method == "POST":
+        if request.form['vehicle_type'] != v.vehicle_type:
+            # Move this vehicle's batches to the new type's usage count
+            used = Batch.query.filter_by(vehicle_id=v.id).count()
+            bump_stat('vehicle_batches', v.vehicle_type, -used); bump_stat('vehicle_batches', request.form['vehicle_type'], used)
         v.vehicle_uid, v.vehicle_type, v.plate_number = request.form['vehicle_uid'], request.form['vehicle_type'], request.form['plate_number']
         v.driver_name, v.color, v.capacity_m3, v.status = request.form.get('driver_name'), request.form.get('color'), float(request.form['capacity_m3']), request.form['status']
         db.session.commit(); flash('Updated.', 'success'); return redirect(url_for('vehicle_list'))
@@ -415,6 +937,7 @@ def vehicle_delete(vehicle_id):
     if not session.get('is_admin'): return redirect(url_for('dashboard'))
     v = Vehicle.query.get_or_404(vehicle_id)
     if Batch.query.filter_by(vehicle_id=vehicle_id, status='In Progress').first(): flash('Cannot delete active vehicle.', 'error'); return redirect(url_for('vehicle_list'))
+    bump_stat('vehicle_batches', v.vehicle_type, -Batch.query.filter_by(vehicle_id=v.id).count())
     db.session.delete(v); db.session.commit(); flash('Deleted.', 'success'); return redirect(url_for('vehicle_list'))
 
 # --- Settings ---
@@ -435,22 +958,339 @@ def change_password():
 @app.route("/analysis")
 def analysis():
     if 'username' not in session: return redirect(url_for('login'))
-    today = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    top_v = db.session.query(Vehicle.vehicle_type, func.count(Batch.id).label('c')).join(Batch, Batch.vehicle_id==Vehicle.id).group_by(Vehicle.vehicle_type).order_by(desc('c')).first()
+    today = datetime.datetime.utcnow().date().isoformat()
+    # A handful of pre-computed rows instead of COUNT(*) over the big tables
+    rows = Stat.query.filter(or_(Stat.metric.in_(['parcels_total', 'batches_type', 'vehicle_batches']), and_(Stat.metric == 'parcels_day', Stat.bucket == today))).all()
+    values = {(r.metric, r.bucket): r.value for r in rows}
+    vehicle_use = [(r.value, r.bucket) for r in rows if r.metric == 'vehicle_batches' and r.value > 0]
     stats = {
-        "parcels_today": db.session.query(Parcel).filter(Parcel.created_time>=today).count(),
-        "parcels_total": db.session.query(Parcel).count(),
-        "small_count": db.session.query(Batch).filter_by(batch_type='small').count(),
-        "medium_count": db.session.query(Batch).filter_by(batch_type='medium').count(),
-        "large_count": db.session.query(Batch).filter_by(batch_type='large').count(),
+        "parcels_today": values.get(('parcels_day', today), 0),
+        "parcels_total": values.get(('parcels_total', ''), 0),
+        "small_count": values.get(('batches_type', 'small'), 0),
+        "medium_count": values.get(('batches_type', 'medium'), 0),
+        "large_count": values.get(('batches_type', 'large'), 0),
         "recent_batches": Batch.query.order_by(Batch.id.desc()).limit(3).all(),
-        "most_used_vehicle": top_v[0] if top_v else "N/A"
+        "most_used_vehicle": max(vehicle_use)[1] if vehicle_use else "N/A"
     }
     return render_template("analysis.html", username=session['username'], stats=stats)
 
+# --- JSON API (v1): for scanners and scripts, bulk writes in one transaction ---
+API_KEY = os.environ.get('API_KEY') # X-API-Key header for clients without a login session
+API_MAX_LIMIT = int(os.environ.get('API_MAX_LIMIT', 5000)) # rows per page
+API_MAX_BULK = int(os.environ.get('API_MAX_BULK', 5000)) # records per write request
+
+API_FIELDS = {
+    'parcel': (Parcel, ['id', 'external_parcel_id', 'parcel_name', 'dimensions', 'weight', 'estimated_volume', 'delivery_address', 'batch_id', 'user_id', 'created_time']),
+    'batch': (Batch, ['id', 'batch_name', 'batch_type', 'current_volume', 'max_volume', 'max_capacity', 'status', 'completion_time', 'vehicle_id']),
+    'vehicle': (Vehicle, ['id', 'vehicle_uid', 'vehicle_type', 'plate_number', 'driver_name', 'color', 'capacity_m3', 'status']),
+}
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+@app.errorhandler(ApiError)
+def api_error(e):
+    db.session.rollback()
+    body = {"error": str(e)}
+    if e.errors: body["errors"] = e.errors
+    return jsonify(body), e.status
+
+def api_user_id():
+    # A logged-in admin, or the API key (recorded as the first admin account)
+    if session.get('is_admin'): return session['user_id']
+    key = request.headers.get('X-API-Key')
+    if API_KEY and key and hmac.compare_digest(key, API_KEY):
+        admin = db.session.query(User.id).filter_by(is_admin=True).order_by(User.id).first()
+        if admin: return admin[0]
+    raise ApiError("authentication required", 401)
+
+def api_read(payload):
+    # ETag on every read: a client sending If-None-Match for unchanged data gets an empty 304
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+def api_fields(resource):
+    # ?fields=a,b selects only those columns (id is always included)
+    model, allowed = API_FIELDS[resource]
+    wanted = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if not wanted: return model, allowed
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown: raise ApiError(f"unknown fields: {', '.join(unknown)}")
+    return model, ['id'] + [f for f in wanted if f != 'id']
+
+def api_row(fields, row):
+    return {f: (v.isoformat() if isinstance(v, datetime.datetime) else v) for f, v in zip(fields, row)}
+
+def api_list(resource, filters):
+    # Keyset pages in id order: ?after=<next from the previous page>&limit=
+    model, fields = api_fields(resource)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), API_MAX_LIMIT)
+    query = db.session.query(*[getattr(model, f) for f in fields]).filter(*filters)
+    after = request.args.get('after', type=int)
+    if after: query = query.filter(model.id > after)
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    items = [api_row(fields, r) for r in rows[:limit]]
+    return api_read({"items": items, "next": items[-1]['id'] if len(rows) > limit else None})
+
+def api_get(resource, item_id):
+    model, fields = api_fields(resource)
+    row = db.session.query(*[getattr(model, f) for f in fields]).filter(model.id == item_id).first()
+    if row is None: raise ApiError(f"{resource} {item_id} not found", 404)
+    return api_read(api_row(fields, row))
+
+def api_records(key):
+    # Bulk payload: a JSON array, or {"<key>": [...]}
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict): payload = payload.get(key)
+    if not isinstance(payload, list) or not payload: raise ApiError(f"expected a non-empty JSON array of {key}")
+    if len(payload) > API_MAX_BULK: raise ApiError(f"at most {API_MAX_BULK} {key} per request", 413)
+    return payload
+
+def api_validate(records, convert):
+    # Check every record before writing anything; report all bad ones at once
+    rows, errors = [], []
+    for i, record in enumerate(records):
+        try:
+            if not isinstance(record, dict): raise ValueError("expected an object")
+            rows.append(convert(record))
+        except KeyError as e: errors.append({"index": i, "error": f"missing {e.args[0]}"})
+        except (TypeError, ValueError) as e: errors.append({"index": i, "error": str(e)})
+    if errors: raise ApiError("nothing saved, invalid records", 400, errors)
+    return rows
+
+def api_text(record, key, default=None):
+    value = record.get(key, default)
+    return None if value is None else str(value).strip()
+
+def api_required(record, key):
+    value = api_text(record, key)
+    if not value: raise ValueError(f"missing {key}")
+    return value
+
+def parcel_from_json(record):
+    volume = float(record['estimated_volume'])
+    if volume < 0: raise ValueError("estimated_volume must not be negative")
+    return {"external_parcel_id": api_required(record, 'external_parcel_id').upper(), "parcel_name": api_text(record, 'parcel_name'),
+            "dimensions": api_text(record, 'dimensions'), "weight": None if record.get('weight') is None else float(record['weight']),
+            "estimated_volume": volume, "delivery_address": api_text(record, 'delivery_address') or Parcel.delivery_address.default.arg}
+
+def vehicle_from_json(record):
+    capacity = float(record.get('capacity_m3', Vehicle.capacity_m3.default.arg))
+    if capacity <= 0: raise ValueError("capacity_m3 must be positive")
+    return {"vehicle_uid": api_required(record, 'vehicle_uid'), "vehicle_type": api_required(record, 'vehicle_type'),
+            "plate_number": api_required(record, 'plate_number'), "driver_name": api_text(record, 'driver_name'),
+            "color": api_text(record, 'color'), "capacity_m3": capacity, "status": api_text(record, 'status', 'Available')}
+
+def api_write(save):
+    # One transaction per request: either every record is saved or none
+    try:
+        body = save()
+        db.session.commit(); forget_counts()
+        return body
+    except ApiError: raise
+    except Exception as e:
+        db.session.rollback()
+        raise ApiError(f"nothing saved: {getattr(e, 'orig', None) or e}", 409)
+
+@app.route("/api/v1/parcels", methods=["GET"])
+def api_parcels():
+    api_user_id()
+    filters = []
+    if 'batch_id' in request.args: filters.append(Parcel.batch_id == request.args.get('batch_id', type=int))
+    if 'external_parcel_id' in request.args: filters.append(Parcel.external_parcel_id == request.args['external_parcel_id'].strip().upper())
+    return api_list('parcel', filters)
+
+@app.route("/api/v1/parcels/<int:parcel_id>")
+def api_parcel(parcel_id):
+    api_user_id()
+    return api_get('parcel', parcel_id)
+
+@app.route("/api/v1/parcels", methods=["POST"])
+def api_parcels_create():
+    # Confirm many analysed parcels at once; each is auto-batched like /confirm_parcel
+    user_id = api_user_id()
+    rows = api_validate(api_records('parcels'), parcel_from_json)
+    def save():
+        ids, batch_names, notes = place_parcels(rows, user_id)
+        return {"created": [{"id": i, "batch_name": n} for i, n in zip(ids, batch_names)], "notes": [m for m, _ in notes]}
+    return jsonify(api_write(save)), 201
+
+@app.route("/api/v1/batches", methods=["GET"])
+def api_batches():
+    api_user_id()
+    filters = [getattr(Batch, f) == request.args[f] for f in ('status', 'batch_type') if f in request.args]
+    if 'vehicle_id' in request.args: filters.append(Batch.vehicle_id == request.args.get('vehicle_id', type=int))
+    return api_list('batch', filters)
+
+@app.route("/api/v1/batches/<int:batch_id>")
+def api_batch(batch_id):
+    api_user_id()
+    return api_get('batch', batch_id)
+
+@app.route("/api/v1/batches/transition", methods=["POST"])
+def api_batches_transition():
+    # {"ids": [...], "status": "Ready"}: one UPDATE for every batch allowed to make that move
+    api_user_id()
+    payload = request.get_json(silent=True) or {}
+    status = payload.get('status')
+    if status not in batch_states.TRANSITIONS: raise ApiError(f"status must be one of {', '.join(batch_states.TRANSITIONS)}")
+    try: ids = sorted({int(i) for i in payload.get('ids') or []})
+    except (TypeError, ValueError): raise ApiError("ids must be a list of batch ids")
+    if not ids: raise ApiError("expected a non-empty list of ids")
+    if len(ids) > API_MAX_BULK: raise ApiError(f"at most {API_MAX_BULK} ids per request", 413)
+
+    def save():
+        # Same rules and vehicle side effects as the buttons in the UI
+        updated = lifecycle.transition(db.session, ids, status)
+        return {"status": status, "updated": updated, "skipped": sorted(set(ids) - set(updated))}
+    return jsonify(api_write(save))
+
+@app.route("/api/v1/vehicles", methods=["GET"])
+def api_vehicles():
+    api_user_id()
+    return api_list('vehicle', [getattr(Vehicle, f) == request.args[f] for f in ('status', 'vehicle_type') if f in request.args])
+
+@app.route("/api/v1/vehicles/<int:vehicle_id>")
+def api_vehicle(vehicle_id):
+    api_user_id()
+    return api_get('vehicle', vehicle_id)
+
+@app.route("/api/v1/vehicles", methods=["POST"])
+def api_vehicles_create():
+    api_user_id()
+    rows = api_validate(api_records('vehicles'), vehicle_from_json)
+    save = lambda: {"created": insert_ids(Vehicle, rows)}
+    return jsonify(api_write(save)), 201
+
+# --- Bulk export / import (CSV, Parquet) ---
+EXPORT_TABLES = {'parcel': Parcel, 'batch': Batch, 'vehicle': Vehicle}
+
+def export_table(name):
+    if name not in EXPORT_TABLES: raise ApiError(f"unknown table: {name}", 404)
+    return EXPORT_TABLES[name].__table__
+
+@app.route("/export/<name>.<fmt>")
+def export_data(name, fmt):
+    # Streams straight from the cursor: memory stays flat however many rows there are
+    api_user_id()
+    table = export_table(name)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    if fmt == 'csv':
+        return app.response_class(bulk_io.iter_csv(db.engine, table), mimetype='text/csv',
+                                  headers={'Content-Disposition': f'attachment; filename={name}-{stamp}.csv'})
+    if fmt == 'parquet':
+        # Parquet writes its footer last, so spool to a temp file (removed once sent)
+        out = tempfile.TemporaryFile()
+        try: bulk_io.write_parquet(db.engine, table, out)
+        except RuntimeError as e:
+            out.close(); raise ApiError(str(e), 501)
+        out.seek(0)
+        return send_file(out, mimetype='application/vnd.apache.parquet', as_attachment=True, download_name=f'{name}-{stamp}.parquet')
+    raise ApiError(f"unknown format: {fmt} (use {' or '.join(bulk_io.FORMATS)})", 404)
+
+def recalculate_batch_volumes(conn):
+    select_sum = db.select(func.sum(Parcel.estimated_volume)).where(Parcel.batch_id == Batch.id).scalar_subquery()
+    conn.execute(update(Batch).values(current_volume=func.coalesce(select_sum, 0.0)))
+
+def import_table(name, path):
+    # One transaction: FTS triggers and secondary indexes are off during the load and
+    # rebuilt once at the end, then batch volumes and dashboard counters are recounted.
+    table = export_table(name)
+    def after_load(conn):
+        search_index.resume(conn, name)
+        if name in ('parcel', 'batch'): recalculate_batch_volumes(conn)
+        if db.engine.dialect.name == 'postgresql':
+            # Rows came in with their ids, move the sequence past them
+            conn.execute(db.text(f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), COALESCE(MAX(id), 1)) FROM {name}"))
+    count = bulk_io.import_file(db.engine, table, path, before_load=lambda conn: search_index.suspend(conn, name), before_commit=after_load)
+    rebuild_stats()
+    forget_counts()
+    return count
+
+@app.cli.command("export")
+@click.argument('name', type=click.Choice(list(EXPORT_TABLES)))
+@click.argument('path')
+def export_command(name, path):
+    """Export a table to PATH (.csv or .parquet)."""
+    started = time.perf_counter()
+    count = bulk_io.export(db.engine, export_table(name), path)
+    print(f"--- [Export] {count} {name} rows -> {path} in {time.perf_counter() - started:.1f}s ---")
+
+@app.cli.command("import")
+@click.argument('name', type=click.Choice(list(EXPORT_TABLES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_command(name, path):
+    """Load PATH (.csv or .parquet, as written by export) into a table."""
+    started = time.perf_counter()
+    try: count = import_table(name, path)
+    except Exception as e:
+        raise click.ClickException(str(getattr(e, 'orig', None) or e))
+    print(f"--- [Import] {count} {name} rows <- {path} in {time.perf_counter() - started:.1f}s ---")
+
+# --- Image archive: photos of completed batches go to the cold tier ---
+@app.cli.command("archive-images")
+@click.option('--days', default=image_store.ARCHIVE_DAYS, show_default=True, help='Batches completed at least this many days ago')
+@click.option('--mode', default=image_store.ARCHIVE_MODE, show_default=True, type=click.Choice(['off', 'move', 'recompress']))
+def archive_images_command(days, mode):
+    """Move (and by default downscale / re-encode) photos of completed batches to IMAGE_ARCHIVE_DIR."""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    keys = db.session.query(Parcel.parcel_name).join(Batch, Parcel.batch_id == Batch.id).filter(
+        Batch.status == 'Completed', Batch.completion_time <= cutoff, Parcel.parcel_name.isnot(None)).distinct()
+    files, before, after = 0, 0, 0
+    for (key,) in keys.yield_per(1000):
+        size_before, size_after = image_store.archive(key, mode)
+        if size_before: files += 1; before += size_before; after += size_after
+    print(f"--- [Images] Archived {files} photos: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({mode}) ---")
+
+def ensure_indexes():
+    # create_all() skips tables that already exist, so add any new indexes by hand.
+    # IF NOT EXISTS because reflection can't see expression indexes like lower(driver_name).
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+def prepare_database():
+    if not database.has_schema(db.engine):
+        metrics.log("DB", message="no tables yet: run `flask --app app db-upgrade`")
+        return
+    search_index.install(db.engine)
+    # First start after the counters were added: backfill them once
+    if Stat.query.first() is None and (Parcel.query.first() or Batch.query.first()): rebuild_stats()
+    metrics.log("DB", message="tables checked")
+
+@app.cli.command("db-upgrade")
+@click.argument('revision', default='head')
+def db_upgrade_command(revision):
+    """Apply the Alembic migrations up to REVISION (default: head)."""
+    try: database.upgrade(db.engine, db.metadata, revision)
+    except RuntimeError as e: raise click.ClickException(str(e))
+    prepare_database()
+
+@app.cli.command("db-revision")
+@click.argument('message')
+def db_revision_command(message):
+    """Write a new migration for the model changes since the last one."""
+    try: script = database.revision(db.engine, db.metadata, message)
+    except RuntimeError as e: raise click.ClickException(str(e))
+    print(f"--- [DB] Wrote {script.path}: review it before running db-upgrade ---")
+
 with app.app_context():
-    db.create_all()
-    print("--- ✅ Database Tables Checked/Created ---")
+    schema = database.schema_mode(app.config['SQLALCHEMY_DATABASE_URI'])
+    if schema == 'create':
+        db.create_all()
+        ensure_indexes()
+    elif schema == 'migrate':
+        database.upgrade(db.engine, db.metadata)
+    prepare_database()
+
+# Optional: load + warm up the model in the background so startup stays fast
+if os.environ.get('AI_WARMUP') == '1':
+    threading.Thread(target=warm_up, name="ai-warmup", daemon=True).start()
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,161 @@
+import os
+import time
+
+import numpy as np
+
+# --- Consolidation planner: pack parcel volumes into vehicles ---
+# Variable-size bin packing. Parcels are sorted by volume (largest first) and
+# placed into vehicles ordered by capacity (largest first), so a new vehicle is
+# only opened when nothing already in use has room. Both first-fit-decreasing
+# and best-fit-decreasing are run and the plan using fewer vehicles wins.
+# Each places parcels exactly as the textbook one-at-a-time rule would, but the
+# following parcels that would pick the same vehicle are placed with it in one
+# step (a cumsum run), which keeps large plans fast. Every loaded
+# vehicle is then swapped for the smallest free one that still takes its load,
+# which pushes the load % up (batch_dispatch warns below LOW_LOAD_PERCENT).
+# With delivery zones, parcels are packed one zone at a time in route order
+# and a vehicle only spills over into the next zone, never a far one.
+
+# --- Settings (override with environment variables) ---
+FILL_LIMIT = float(os.environ.get('PLAN_FILL_LIMIT', 0.9)) # fraction of capacity to fill, same as Batch.max_capacity (90%)
+LOW_LOAD_PERCENT = 70
+EPS = 1e-9
+RUN_WINDOW = 4096 # parcels checked at once when extending a best-fit run
+
+# A strategy picks the vehicle b for parcel i and returns (b, end): parcels i..end-1
+# all go into b, each being where the one-at-a-time rule would have put it.
+def _run_end(csum, i, stop, room):
+    # Parcels from i on that fit into `room` together (volumes sorted descending)
+    return min(int(np.searchsorted(csum, csum[i] + room + EPS, side='right')) - 1, stop)
+
+def _first_fit(room, allowed, used, volumes, csum, i, stop):
+    # First (largest) vehicle that takes parcel i. Later parcels follow it while they are
+    # still too big for every vehicle before it, which they would otherwise go into.
+    b = int(np.argmax(allowed & (room + EPS >= volumes[i])))
+    before = room[:b][allowed[:b]].max(initial=-1.0)
+    end = _run_end(csum, i, stop, room[b])
+    return b, i + int(np.searchsorted(-volumes[i:end], -(before + EPS), side='left'))
+
+def _best_fit(room, allowed, used, volumes, csum, i, stop):
+    # Tightest vehicle already in use, else open the largest free one. Later parcels follow
+    # it until another vehicle in use would take them with as little room or less.
+    fits = allowed & (room + EPS >= volumes[i])
+    candidates = fits & used
+    b = int(np.where(candidates, room, np.inf).argmin()) if candidates.any() else int(np.argmax(fits))
+    end = min(_run_end(csum, i, stop, room[b]), i + RUN_WINDOW)
+    others = allowed & used
+    others[b] = False
+    rooms = np.sort(room[others])
+    j = np.arange(i + 1, end)
+    left = room[b] - (csum[j] - csum[i]) # room in b when parcel j comes
+    tighter = np.flatnonzero(np.searchsorted(rooms, left, side='right') > np.searchsorted(rooms, volumes[j] - EPS, side='left'))
+    return b, int(j[tighter[0]]) if len(tighter) else end
+
+STRATEGIES = {"first-fit-decreasing": _first_fit, "best-fit-decreasing": _best_fit}
+
+def _pack(volumes, limits, strategy, bounds):
+    # volumes sorted descending inside each [bounds[k], bounds[k+1]) zone segment, limits sorted
+    # descending. Returns the vehicle per item (-1 = unplaced).
+    n = len(volumes)
+    assigned = np.full(n, -1, dtype=np.int64)
+    room = limits.astype(np.float64).copy()
+    used = np.zeros(len(limits), dtype=bool)
+    csum = np.concatenate(([0.0], np.cumsum(volumes)))
+    # searchsorted wants ascending order
+    neg_volumes = -volumes
+    last = -1
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        # A vehicle only carries neighbouring zones: fresh vehicles, the ones this
+        # zone opened, and the one the previous zone was still loading
+        allowed = ~used
+        if last >= 0: allowed[last] = True
+        i = start
+        while i < stop:
+            open_room = np.where(allowed, room, 0.0)
+            largest_room = open_room.max() if len(room) else 0.0
+            if volumes[i] > largest_room + EPS:
+                # Skip every item in this zone that is too big for the room left, in one step
+                i = start + int(np.searchsorted(neg_volumes[start:stop], -(largest_room + EPS), side='left'))
+                continue
+            b, end = strategy(room, allowed, used, volumes, csum, i, stop)
+            assigned[i:end] = b
+            room[b] -= csum[end] - csum[i]
+            used[b] = True
+            last = b
+            i = end
+    return assigned
+
+def _right_size(loads, limits):
+    # Heaviest load first, each onto the smallest free vehicle that takes it
+    order = np.argsort(limits, kind='stable')
+    sorted_limits = limits[order]
+    taken = np.zeros(len(limits), dtype=bool)
+    new_vehicle = {}
+    for b in sorted(loads, key=loads.get, reverse=True):
+        # A load may pass its limit by the EPS fit tolerance plus rounding in the sums
+        start = int(np.searchsorted(sorted_limits, loads[b] - 2 * EPS, side='left'))
+        free = np.flatnonzero(~taken[start:])
+        taken[start + free[0]] = True
+        new_vehicle[b] = int(order[start + free[0]])
+    return new_vehicle
+
+def plan(volumes, capacities, fill_limit=FILL_LIMIT, strategies=STRATEGIES, zones=None):
+    # volumes: m³ per parcel, capacities: m³ per available vehicle (positions are kept in the result).
+    # zones: optional route rank per parcel; parcels are then packed zone by zone in that order.
+    started = time.perf_counter()
+    volumes = np.asarray(volumes, dtype=np.float64)
+    capacities = np.asarray(capacities, dtype=np.float64)
+    if zones is None:
+        item_order = np.argsort(-volumes, kind='stable')
+        bounds = [0, len(volumes)]
+    else:
+        zones = np.asarray(zones)
+        item_order = np.lexsort((-volumes, zones))
+        bounds = [0, *(np.flatnonzero(np.diff(zones[item_order])) + 1).tolist(), len(volumes)]
+    vehicle_order = np.argsort(-capacities, kind='stable')
+    sorted_volumes = volumes[item_order]
+    limits = capacities[vehicle_order] * fill_limit
+
+    best = None
+    for name, strategy in strategies.items():
+        assigned = _pack(sorted_volumes, limits, strategy, bounds)
+        placed = assigned >= 0
+        loads = np.bincount(assigned[placed], weights=sorted_volumes[placed], minlength=len(limits))
+        # Fewest unplaced m³ first, then fewest vehicles
+        score = (round(float(sorted_volumes[~placed].sum()), 9), int((loads > 0).sum()))
+        if best is None or score < best[0]:
+            best = (score, name, assigned, loads)
+    _, strategy, assigned, loads = best
+
+    placed = np.flatnonzero(assigned >= 0)
+    bins = np.unique(assigned[placed])
+    moves = _right_size({int(b): float(loads[b]) for b in bins}, limits)
+    # Group items by vehicle in one pass instead of a mask per vehicle
+    by_vehicle = placed[np.argsort(assigned[placed], kind='stable')]
+    groups = np.split(by_vehicle, np.searchsorted(assigned[by_vehicle], bins[1:], side='left'))
+
+    vehicles = []
+    for b, items in zip(bins.tolist(), groups):
+        vehicle = int(vehicle_order[moves[b]])
+        capacity = float(capacities[vehicle])
+        load = float(loads[b])
+        vehicles.append({"vehicle": vehicle, "items": item_order[items], "load": load, "capacity": capacity,
+                         "load_percent": round(load / capacity * 100, 1) if capacity else 0.0})
+    vehicles.sort(key=lambda v: v["load_percent"], reverse=True)
+
+    unplaced = item_order[assigned < 0]
+    total = float(volumes.sum())
+    return {
+        "strategy": strategy,
+        "vehicles": vehicles,
+        "unplaced": unplaced,
+        "parcel_count": len(volumes),
+        "zones": len(bounds) - 1 if len(volumes) else 0,
+        "total_volume": total,
+        "unplaced_volume": float(volumes[unplaced].sum()),
+        "vehicles_available": len(capacities),
+        "vehicles_used": len(vehicles),
+        "low_load": sum(1 for v in vehicles if v["load_percent"] < LOW_LOAD_PERCENT),
+        "average_load_percent": round(sum(v["load"] for v in vehicles) / sum(v["capacity"] for v in vehicles) * 100, 1) if vehicles else 0.0,
+        "seconds": time.perf_counter() - started,
+    }
@@ -0,0 +1,61 @@
+import datetime
+
+from sqlalchemy import update
+
+# --- Batch lifecycle: In Progress -> Full -> Ready -> Transporting -> Completed ---
+# Every status change of a batch goes through here, so the rules live in one
+# place: which moves are legal, which need a vehicle, and what happens to the
+# vehicle. A transition is one UPDATE ... WHERE over all the batches asked for
+# (the WHERE holds the rules, batches in the wrong state are simply skipped)
+# plus one UPDATE for their vehicles, however many batches there are.
+#   In Progress  open, parcels are still being added
+#   Full         reached max_capacity (set by the parcel allocator)
+#   Ready        dispatched by an admin, waiting for the driver
+#   Transporting the driver has started
+#   Completed    delivered, the vehicle is free again
+
+OPEN = ('In Progress', 'Full') # still taking parcels / re-plannable
+# target status -> statuses it may be entered from
+TRANSITIONS = {
+    'Full': ('In Progress',),
+    'Ready': ('In Progress', 'Full'), # dispatch
+    'Transporting': ('Ready',), # driver starts
+    'Completed': ('Full', 'Ready', 'Transporting'),
+}
+NEEDS_VEHICLE = ('Ready', 'Transporting')
+# Status of a vehicle assigned to a batch in each state
+VEHICLE_STATUS = {'In Progress': 'Reserved', 'Full': 'Reserved', 'Ready': 'Reserved',
+                  'Transporting': 'Transporting', 'Completed': 'Available'}
+
+class BatchLifecycle:
+    # Bound to the app's Batch / Vehicle models (this module doesn't import the app)
+    def __init__(self, batch, vehicle):
+        self.Batch, self.Vehicle = batch, vehicle
+
+    def transition(self, session, ids, status, sources=None):
+        # Move every batch in `ids` that may go to `status`; returns the ids that moved.
+        # `sources` narrows the legal starting states further (e.g. only finalize Full batches).
+        if status not in TRANSITIONS: raise ValueError(f"unknown batch status: {status}")
+        sources = [s for s in TRANSITIONS[status] if sources is None or s in sources]
+        if not ids or not sources: return []
+        Batch = self.Batch
+        conditions = [Batch.id.in_(ids), Batch.status.in_(sources)]
+        if status in NEEDS_VEHICLE: conditions.append(Batch.vehicle_id.isnot(None))
+        values = {"status": status}
+        if status == 'Completed': values["completion_time"] = datetime.datetime.now()
+        moved = session.execute(update(Batch).where(*conditions).values(**values).returning(Batch.id, Batch.vehicle_id),
+                                execution_options={"synchronize_session": False}).all()
+        vehicle_ids = sorted({v for _, v in moved if v})
+        if status == 'Completed': self.release(session, vehicle_ids)
+        elif vehicle_ids:
+            session.execute(update(self.Vehicle).where(self.Vehicle.id.in_(vehicle_ids)).values(status=VEHICLE_STATUS[status]),
+                            execution_options={"synchronize_session": False})
+        return sorted(i for i, _ in moved)
+
+    def release(self, session, vehicle_ids):
+        # Vehicles become Available again, unless another unfinished batch still has them
+        if not vehicle_ids: return
+        Batch, Vehicle = self.Batch, self.Vehicle
+        busy = session.query(Batch.id).filter(Batch.vehicle_id == Vehicle.id, Batch.status != 'Completed').exists()
+        session.execute(update(Vehicle).where(Vehicle.id.in_(vehicle_ids), ~busy).values(status=VEHICLE_STATUS['Completed']),
+                        execution_options={"synchronize_session": False})
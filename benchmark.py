@@ -0,0 +1,355 @@
+# --- Offline benchmark for the AI analyzer and the busiest Flask routes ---
+#   python benchmark.py --parcels 100000 --batches 5000 --vehicles 500
+#   python benchmark.py --compare bench_results/old.json bench_results/new.json
+# Runs against a throwaway SQLite file and synthetic parcel photos, so
+# project.db, static/uploads, the analysis cache and job files are never touched. When models/best.pt or the
+# tesseract binary is missing, a stub stands in and the JSON says so.
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import cv2
+from sqlalchemy import event, create_engine
+
+BENCH_DIR = tempfile.mkdtemp(prefix="ptp_bench_")
+# These have to be set before app / ai_analyzer are imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(BENCH_DIR, 'bench.db')
+os.environ['IMAGE_DIR'] = os.path.join(BENCH_DIR, 'uploads')
+os.environ['AI_CACHE_PATH'] = os.path.join(BENCH_DIR, 'analysis_cache.db')
+os.environ['ANALYSIS_JOB_DIR'] = os.path.join(BENCH_DIR, 'jobs')
+os.environ['PROFILE_DIR'] = os.path.join(BENCH_DIR, 'profiles')
+os.environ.setdefault('AI_CACHE', '0') # measure real work, not cache hits
+
+import ai_analyzer
+import batch_planner
+import bulk_io
+import route_planner
+import search_index
+import app as webapp
+from app import app, db, User, Vehicle, Batch, Parcel
+
+# --- Stubs (only used when the real thing is not installed) ---
+class _StubTensor(np.ndarray):
+    def cpu(self): return self
+    def numpy(self): return np.asarray(self)
+
+class _StubBox:
+    def __init__(self, xywh, cls):
+        self.xywh = np.array([xywh], dtype=np.float32).view(_StubTensor)
+        self.cls = np.array([cls], dtype=np.float32).view(_StubTensor)
+
+class _StubBoxes:
+    def __init__(self, h, w):
+        # One parcel in the middle, one ruler along the bottom
+        self._rows = [((w / 2, h / 2, w * 0.5, h * 0.4), 0), ((w / 2, h * 0.9, w * 0.3, h * 0.03), 1)]
+        xywh = np.array([r[0] for r in self._rows], dtype=np.float32)
+        self.xywh = xywh.view(_StubTensor)
+        self.xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1).view(_StubTensor)
+        self.cls = np.array([r[1] for r in self._rows], dtype=np.float32).view(_StubTensor)
+        self.conf = np.full(len(self._rows), 0.9, dtype=np.float32).view(_StubTensor)
+    def __iter__(self): return (_StubBox(*r) for r in self._rows)
+    def __len__(self): return len(self._rows)
+
+class _StubResult:
+    def __init__(self, h, w): self.boxes = _StubBoxes(h, w)
+
+class StubModel:
+    # Costs roughly what a small CPU detector does per image
+    def __init__(self, delay=0.02): self.delay = delay
+    def __call__(self, source, **kwargs):
+        sources = source if isinstance(source, list) else [source]
+        results = []
+        for src in sources:
+            time.sleep(self.delay)
+            h, w = (src.shape[:2] if isinstance(src, np.ndarray) else (1080, 1440))
+            results.append(_StubResult(h, w))
+        return results
+
+def install_stubs():
+    used = {"model": False, "tesseract": False}
+    if not ai_analyzer.get_model():
+        ai_analyzer.model, ai_analyzer._model_loaded = StubModel(), True
+        used["model"] = True
+    if not shutil.which(ai_analyzer.pytesseract.pytesseract.tesseract_cmd):
+        ai_analyzer.pytesseract.image_to_string = lambda img, config='': "SHIP TO CLIENT A SPX" + str(random.randint(10**9, 10**10))
+        used["tesseract"] = True
+    return used
+
+# --- Synthetic data ---
+def make_images(count, size=(1080, 1440)):
+    rng = np.random.default_rng(42)
+    paths = []
+    for i in range(count):
+        img = rng.integers(90, 140, (size[0], size[1], 3), dtype=np.uint8)
+        cv2.rectangle(img, (400, 250), (1050, 800), (60, 110, 170), -1) # the parcel
+        cv2.rectangle(img, (550, 350), (900, 450), (245, 245, 245), -1) # the label
+        cv2.putText(img, f"SPX{1000000000 + i}", (565, 415), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (0, 0, 0), 3)
+        path = os.path.join(BENCH_DIR, f"parcel_{i}.jpg")
+        cv2.imwrite(path, img)
+        paths.append(path)
+    return paths
+
+def seed_database(parcels, batches, vehicles, chunk=20000):
+    rng = random.Random(42)
+    types = ['small', 'medium', 'large']
+    statuses = ['In Progress', 'Full', 'Ready', 'Transporting', 'Completed']
+    now = datetime.datetime.utcnow()
+    with app.app_context():
+        db.drop_all(); db.create_all()
+        admin = User(username='admin', is_admin=True); admin.set_password('admin')
+        db.session.add(admin); db.session.commit()
+
+        insert_rows = lambda model, rows: rows and db.session.execute(db.insert(model), rows)
+        insert_rows(Vehicle, [
+            {"vehicle_uid": f"V{i:05d}", "vehicle_type": rng.choice(['Van', 'Lorry', 'Truck']), "plate_number": f"BENCH{i:05d}",
+             "driver_name": f"driver{i % 50}", "capacity_m3": rng.choice([2.0, 5.0, 10.0]), "status": rng.choice(['Available', 'Reserved', 'Transporting'])}
+            for i in range(vehicles)])
+        insert_rows(Batch, [
+            {"batch_name": f"Bench-{i:06d} ({types[i % 3]})", "batch_type": types[i % 3], "current_volume": rng.uniform(0, 0.8),
+             "max_volume": 2.0, "max_capacity": 90.0, "status": statuses[i % 5], "vehicle_id": rng.randint(1, vehicles) if vehicles and i % 2 else None}
+            for i in range(batches)])
+        for start in range(0, parcels, chunk):
+            insert_rows(Parcel, [
+                {"external_parcel_id": f"SPX{2000000000 + i}", "dimensions": "30*20*10cm", "weight": 0.18, "estimated_volume": rng.uniform(0.001, 0.08),
+                 "parcel_name": f"parcel_{i}.jpg", "delivery_address": f"Client {chr(65 + i % 26)}", "user_id": admin.id,
+                 "batch_id": rng.randint(1, batches) if batches else None, "created_time": now - datetime.timedelta(minutes=i)}
+                for i in range(start, min(start + chunk, parcels))])
+        db.session.commit()
+        # drop_all() took the search triggers with it; put them back and reindex
+        search_index.install(db.engine)
+        search_index.rebuild(db.engine)
+        webapp.rebuild_stats()
+        return admin.id
+
+# --- Measurement ---
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples: return {}
+    pick = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)] * 1000
+    total = sum(samples)
+    return {"n": len(samples), "mean_ms": round(statistics.mean(samples) * 1000, 2), "p50_ms": round(pick(0.50), 2),
+            "p90_ms": round(pick(0.90), 2), "p99_ms": round(pick(0.99), 2), "max_ms": round(samples[-1] * 1000, 2),
+            "throughput_per_s": round(len(samples) / total, 2) if total else 0.0}
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); samples.append(time.perf_counter() - t)
+    return samples
+
+def bench_analyzer(paths, repeat):
+    stages = {"ocr": [], "yolo": [], "analyze_parcel_image": []}
+    ocr_parts = {}
+    for i in range(repeat):
+        path = paths[i % len(paths)]
+        image = ai_analyzer.load_image(path)
+        timings = {}
+        t = time.perf_counter(); ai_analyzer.analyze_image_with_ocr(path, image, None, timings); stages["ocr"].append(time.perf_counter() - t)
+        for k, v in timings.items(): ocr_parts.setdefault(f"ocr.{k}", []).append(v)
+        t = time.perf_counter(); ai_analyzer.estimate_dimensions_yolo(path, image); stages["yolo"].append(time.perf_counter() - t)
+        t = time.perf_counter(); ai_analyzer.analyze_parcel_image(path); stages["analyze_parcel_image"].append(time.perf_counter() - t)
+    stages.update(ocr_parts)
+    t = time.perf_counter(); ai_analyzer.analyze_parcel_images(paths); bulk = time.perf_counter() - t
+    out = {name: summarize(s) for name, s in stages.items()}
+    out["analyze_parcel_images"] = {"n": len(paths), "total_ms": round(bulk * 1000, 2), "images_per_s": round(len(paths) / bulk, 2)}
+    # A pallet shot: 40 parcel boxes and 2 rulers measured in one pass
+    rng = np.random.default_rng(0)
+    xywh = np.concatenate([rng.uniform(50, 400, (40, 4)), [[700, 1000, 600, 20], [300, 1000, 610, 22]]])
+    cls = np.array([0] * 40 + [1, 1])
+    out["measure_boxes_40"] = summarize(timed(lambda: ai_analyzer.measure_boxes(xywh, cls), repeat * 100))
+    return out
+
+def bench_routes(admin_id, repeat):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['user_id'], s['username'], s['is_admin'] = admin_id, 'admin', True
+    form = lambda i: {"image_filename": f"bench_{i}.jpg", "external_parcel_id": f"SPX{3000000000 + i}", "delivery_address": "Client A",
+                      "dimensions": "30*20*10cm", "weight": "0.2", "estimated_volume": str(round(0.001 + (i % 80) / 1000, 4))}
+    api_parcel = lambda i: {"external_parcel_id": f"SPX{4000000000 + i}", "delivery_address": "Client B", "dimensions": "30*20*10cm",
+                            "weight": 0.2, "estimated_volume": round(0.001 + (i % 80) / 1000, 4)}
+    routes = {
+        "GET /parcel_list": lambda i: client.get('/parcel_list'),
+        "GET /parcel_list?search": lambda i: client.get('/parcel_list?search_query=SPX2000001'),
+        "GET /batch_list": lambda i: client.get('/batch_list'),
+        "GET /batch/<id>": lambda i: client.get('/batch/1'),
+        "GET /analysis": lambda i: client.get('/analysis'),
+        "GET /batch/plan": lambda i: client.get('/batch/plan'),
+        "POST /confirm_parcel": lambda i: client.post('/confirm_parcel', data=form(i)),
+        "GET /api/v1/parcels?limit=1000": lambda i: client.get('/api/v1/parcels?limit=1000&fields=external_parcel_id,estimated_volume,batch_id'),
+        "POST /api/v1/parcels x1000": lambda i: client.post('/api/v1/parcels', json=[api_parcel(i * 1000 + n) for n in range(1000)]),
+    }
+    # Count SQL statements per request; list pages should stay constant as the data grows
+    queries = [0]
+    def count_query(*args): queries[0] += 1
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count_query)
+
+    out = {}
+    for name, call in routes.items():
+        counter = iter(range(repeat))
+        call(0) # warm Jinja / SQLite page cache
+        queries[0] = 0
+        samples = timed(lambda: call(next(counter)), repeat)
+        out[name] = summarize(samples)
+        out[name]["queries_per_request"] = round(queries[0] / repeat, 1)
+        print(f"--- [Bench] {name}: {out[name]} ---")
+    return out
+
+def bench_planner(parcels, vehicles, repeat):
+    # Packing core only (no database), on the same volume / capacity mix as seed_database
+    rng = np.random.default_rng(42)
+    volumes = rng.uniform(0.001, 0.08, parcels)
+    capacities = rng.choice([2.0, 5.0, 10.0], max(vehicles, 1))
+    result = batch_planner.plan(volumes, capacities)
+    out = summarize(timed(lambda: batch_planner.plan(volumes, capacities), repeat))
+    out.update(parcels=parcels, vehicles=len(capacities), strategy=result["strategy"], vehicles_used=result["vehicles_used"],
+               average_load_percent=result["average_load_percent"], unplaced=len(result["unplaced"]))
+    print(f"--- [Bench] Planner: {out} ---")
+    return out
+
+def bench_route(stops, repeat):
+    # Stop ordering for one big run: synthetic geocode table around Johor Bahru, route cache bypassed
+    rng = np.random.default_rng(42)
+    path = os.path.join(BENCH_DIR, 'geocodes.csv')
+    with open(path, 'w') as f:
+        f.write("address,lat,lon,zone\ndepot,1.4927,103.7414,\n")
+        for i, (lat, lon) in enumerate(zip(rng.uniform(1.3, 1.7, stops), rng.uniform(103.5, 104.0, stops))):
+            f.write(f"Client {i},{lat:.5f},{lon:.5f},\n")
+    route_planner.geocoder = route_planner.Geocoder(path)
+    rows = [(f"Client {i}", 1) for i in range(stops)]
+    route = route_planner.plan_route(rows)
+    out = summarize(timed(lambda: route_planner._plan_route(rows), repeat))
+    out.update(stops=stops, zones=route["zones"], total_km=route["total_km"])
+    print(f"--- [Bench] Route ordering: {out} ---")
+    return out
+
+def bench_bulk_io():
+    # Export the seeded parcel table, then load it into an empty database of the same schema
+    table = Parcel.__table__
+    out = {}
+    for ext in bulk_io.FORMATS:
+        path = os.path.join(BENCH_DIR, f'parcel.{ext}')
+        try:
+            t = time.perf_counter(); rows = bulk_io.export(db.engine, table, path)
+            out[f"export_{ext}_seconds"] = round(time.perf_counter() - t, 3)
+        except RuntimeError as e:
+            print(f"--- [Bench] Skipping {ext}: {e} ---"); continue
+        engine = create_engine('sqlite:///' + os.path.join(BENCH_DIR, f'import_{ext}.db'))
+        db.metadata.create_all(engine)
+        t = time.perf_counter(); bulk_io.import_file(engine, table, path)
+        out[f"import_{ext}_seconds"] = round(time.perf_counter() - t, 3)
+        out["rows"] = rows
+        engine.dispose()
+    print(f"--- [Bench] Bulk export/import: {out} ---")
+    return out
+
+def stress_confirm(admin_id, threads, per_thread):
+    # Many admins confirming at once against SQLite (WAL, set by database.py), then check nothing was lost
+    with app.app_context():
+        parcels_before = db.session.query(db.func.count(Parcel.id)).scalar()
+    barrier = threading.Barrier(threads)
+    latencies, failures = [], []
+
+    def client_loop(n):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s['user_id'], s['username'], s['is_admin'] = admin_id, 'admin', True
+        barrier.wait()
+        for i in range(per_thread):
+            volume = round(0.002 + ((n * per_thread + i) % 90) / 1000, 4)
+            t = time.perf_counter()
+            r = client.post('/confirm_parcel', data={"image_filename": f"stress_{n}_{i}.jpg", "external_parcel_id": f"ST{n:03d}{i:05d}", "delivery_address": "Client A",
+                                                     "dimensions": "30*20*10cm", "weight": "0.2", "estimated_volume": str(volume)})
+            latencies.append(time.perf_counter() - t)
+            if r.status_code != 302: failures.append(r.status_code)
+
+    workers = [threading.Thread(target=client_loop, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for w in workers: w.start()
+    for w in workers: w.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        added = db.session.query(db.func.count(Parcel.id)).scalar() - parcels_before
+        sums = dict(db.session.query(Parcel.batch_id, db.func.sum(Parcel.estimated_volume)).group_by(Parcel.batch_id).all())
+        auto = Batch.query.filter(Batch.batch_name.like('Auto-%')).all()
+        drift = max([abs(b.current_volume - sums.get(b.id, 0.0)) for b in auto] or [0.0])
+        overfilled = [b.id for b in auto if b.status == 'In Progress' and b.current_volume / b.max_volume * 100 >= b.max_capacity]
+        open_per_type = db.session.query(Batch.batch_type, db.func.count(Batch.id)).filter(Batch.status == 'In Progress', Batch.batch_name.like('Auto-%')).group_by(Batch.batch_type).all()
+    result = dict(summarize(latencies), threads=threads, confirmations=threads * per_thread, parcels_saved=added,
+                  failed_requests=len(failures), max_volume_drift=round(drift, 6), overfilled_open_batches=len(overfilled),
+                  open_auto_batches_per_type=dict(open_per_type), wall_throughput_per_s=round(threads * per_thread / elapsed, 2),
+                  ok=added == threads * per_thread and not failures and drift < 1e-6 and not overfilled)
+    print(f"--- [Bench] Stress confirm_parcel: {result} ---")
+    return result
+
+def compare(old_path, new_path):
+    old, new = json.load(open(old_path)), json.load(open(new_path))
+    for section in ('routes', 'analyzer'):
+        for name, stats in new.get(section, {}).items():
+            before = old.get(section, {}).get(name, {})
+            key = 'p50_ms' if 'p50_ms' in stats else 'total_ms'
+            if key in before and before[key]:
+                change = (stats[key] - before[key]) / before[key] * 100
+                print(f"{section:9} {name:28} {key} {before[key]:>10.2f} -> {stats[key]:>10.2f}  ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analyzer and hot Flask routes.")
+    parser.add_argument('--parcels', type=int, default=10000)
+    parser.add_argument('--batches', type=int, default=1000)
+    parser.add_argument('--vehicles', type=int, default=200)
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--stops', type=int, default=3000, help='delivery stops for the route ordering benchmark')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--skip-analyzer', action='store_true')
+    parser.add_argument('--skip-routes', action='store_true')
+    parser.add_argument('--stress', type=int, default=0, metavar='THREADS', help='parallel confirm_parcel clients (0 = off)')
+    parser.add_argument('--stress-per-thread', type=int, default=50)
+    parser.add_argument('--out', default=os.path.join('bench_results', datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'))
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare); return
+
+    # The repo keeps its templates next to app.py
+    if not os.path.isdir(os.path.join(webapp.basedir, 'templates')):
+        app.template_folder = webapp.basedir
+
+    results = {"created": datetime.datetime.now().isoformat(timespec='seconds'), "python": sys.version.split()[0],
+               "config": vars(args), "stubs": install_stubs()}
+    print(f"--- [Bench] Stubs in use: {results['stubs']} ---")
+
+    if not args.skip_analyzer:
+        paths = make_images(args.images)
+        results["analyzer"] = bench_analyzer(paths, args.repeat)
+    if not args.skip_routes:
+        t = time.perf_counter()
+        admin_id = seed_database(args.parcels, args.batches, args.vehicles)
+        results["seed_seconds"] = round(time.perf_counter() - t, 2)
+        print(f"--- [Bench] Seeded {args.parcels} parcels / {args.batches} batches / {args.vehicles} vehicles in {results['seed_seconds']}s ---")
+        results["routes"] = bench_routes(admin_id, args.repeat)
+        results["planner"] = bench_planner(args.parcels, args.vehicles, args.repeat)
+        results["route"] = bench_route(args.stops, max(args.repeat // 4, 1))
+        with app.app_context(): results["bulk_io"] = bench_bulk_io()
+        if args.stress:
+            results["stress"] = stress_confirm(admin_id, args.stress, args.stress_per_thread)
+
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"--- [Bench] Results written to {args.out} ---")
+    shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
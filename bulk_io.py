@@ -0,0 +1,153 @@
+import csv
+import datetime
+import io
+import itertools
+import os
+
+from sqlalchemy import select, Boolean, DateTime, Float, Integer
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+# --- Bulk export / import (CSV and Parquet), constant memory at any table size ---
+# Exports read through a server-side cursor in CHUNK_SIZE partitions (psycopg2
+# named cursor on PostgreSQL; SQLite steps its cursor lazily anyway). Imports go
+# in as executemany batches inside one transaction, with the table's secondary
+# indexes dropped first and rebuilt once at the end.
+
+# --- Settings (override with environment variables) ---
+CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 10000))
+FORMATS = ('csv', 'parquet')
+
+def _require_pyarrow():
+    # Parquet is optional: pip install pyarrow
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet needs pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+def _chunks(engine, table, chunk_size):
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(select(table).order_by(*table.primary_key.columns))
+        for rows in result.partitions(chunk_size):
+            yield rows
+
+# --- Export ---
+def _csv_value(value):
+    if isinstance(value, datetime.datetime): return value.isoformat(sep=' ')
+    return '' if value is None else value
+
+def iter_csv(engine, table, chunk_size=CHUNK_SIZE):
+    # Text pieces of the CSV file (header first), one per chunk: feed to a streaming response or a file
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([c.name for c in table.columns])
+    for rows in _chunks(engine, table, chunk_size):
+        writer.writerows([_csv_value(v) for v in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0); buffer.truncate()
+    if buffer.tell(): yield buffer.getvalue() # empty table: header only
+
+def _arrow_schema(pa, table):
+    def arrow_type(column):
+        if isinstance(column.type, Integer): return pa.int64()
+        if isinstance(column.type, Float): return pa.float64()
+        if isinstance(column.type, Boolean): return pa.bool_()
+        if isinstance(column.type, DateTime): return pa.timestamp('us')
+        return pa.string()
+    return pa.schema([(c.name, arrow_type(c)) for c in table.columns])
+
+def write_parquet(engine, table, out, chunk_size=CHUNK_SIZE):
+    # One row group per chunk, so only one chunk is ever held in memory
+    pa, pq = _require_pyarrow()
+    schema = _arrow_schema(pa, table)
+    names = [c.name for c in table.columns]
+    count = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in _chunks(engine, table, chunk_size):
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays([pa.array(col, type=schema.field(name).type) for name, col in zip(names, columns)], schema=schema))
+            count += len(rows)
+    return count
+
+def export(engine, table, path, chunk_size=CHUNK_SIZE):
+    # Format from the extension. Returns the number of rows written.
+    if path.endswith('.parquet'): return write_parquet(engine, table, path, chunk_size)
+    count = -1 # header
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for piece in iter_csv(engine, table, chunk_size):
+            f.write(piece); count += piece.count('\r\n')
+    return count
+
+# --- Import ---
+def _converter(column):
+    if isinstance(column.type, Integer): return int
+    if isinstance(column.type, Float): return float
+    if isinstance(column.type, Boolean): return lambda v: v.strip().lower() in ('1', 'true', 'yes')
+    if isinstance(column.type, DateTime): return datetime.datetime.fromisoformat
+    return str
+
+def _check_columns(table, names):
+    unknown = [n for n in names if n not in table.c]
+    if unknown: raise ValueError(f"unknown columns for {table.name}: {', '.join(unknown)}")
+
+# Both readers yield (column names, one list of values per column) per chunk
+def _csv_batches(table, path, chunk_size):
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        names = next(reader, [])
+        _check_columns(table, names)
+        convert = [_converter(table.c[n]) for n in names]
+        line = 1
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows: return
+            if any(len(r) != len(names) for r in rows):
+                bad = next(i for i, r in enumerate(rows) if len(r) != len(names))
+                raise ValueError(f"{os.path.basename(path)} line {line + bad + 1}: expected {len(names)} fields")
+            columns = []
+            for name, f, values in zip(names, convert, zip(*rows)):
+                try: columns.append([f(v) if v != '' else None for v in values])
+                except ValueError as e: raise ValueError(f"{os.path.basename(path)} lines {line + 1}-{line + len(rows)}, column {name}: {e}")
+            line += len(rows)
+            yield names, columns
+
+def _parquet_batches(table, path, chunk_size):
+    _, pq = _require_pyarrow()
+    parquet = pq.ParquetFile(path)
+    names = parquet.schema_arrow.names
+    _check_columns(table, names)
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        yield names, [batch.column(i).to_pylist() for i in range(len(names))]
+
+def _insert_many(conn, table, names, columns):
+    # Straight to cursor.executemany: the INSERT is compiled and the type conversions
+    # picked once per chunk, then applied a column at a time
+    compiled = table.insert().compile(dialect=conn.dialect, column_keys=names)
+    values = {}
+    for name, column in zip(names, columns):
+        process = table.c[name].type.bind_processor(conn.dialect)
+        values[name] = [process(v) for v in column] if process else column
+    if compiled.positional:
+        params = list(zip(*(values[n] for n in compiled.positiontup)))
+    else:
+        params = [dict(zip(names, row)) for row in zip(*(values[n] for n in names))]
+    conn.exec_driver_sql(compiled.string, params)
+    return len(params)
+
+def import_file(engine, table, path, chunk_size=CHUNK_SIZE, before_load=None, before_commit=None):
+    # All-or-nothing load of `path` into `table`. The hooks run inside the same transaction,
+    # before_load(conn) ahead of the rows (switch off triggers), before_commit(conn) after
+    # them (rebuild derived data). Returns the number of rows.
+    batches = _parquet_batches(table, path, chunk_size) if path.endswith('.parquet') else _csv_batches(table, path, chunk_size)
+    indexes = list(table.indexes)
+    count = 0
+    with engine.begin() as conn:
+        # Deferred index maintenance: one sorted build at the end beats a B-tree insert per row
+        for index in indexes: conn.execute(DropIndex(index, if_exists=True))
+        if before_load: before_load(conn)
+        for names, columns in batches:
+            count += _insert_many(conn, table, names, columns)
+        for index in indexes: conn.execute(CreateIndex(index, if_not_exists=True))
+        if before_commit: before_commit(conn)
+    return count
@@ -0,0 +1,92 @@
+import os
+
+from sqlalchemy import event, inspect
+
+import metrics
+
+# --- Database engine: backend, pooling, pragmas, schema migrations ---
+# DATABASE_URL picks the backend (default: the SQLite file next to app.py).
+# SQLite gets WAL + busy_timeout on every connection so several gunicorn
+# workers can write without "database is locked"; PostgreSQL gets a sized,
+# pre-pinged connection pool (per worker process).
+# The schema is owned by Alembic (migrations/). DB_SCHEMA decides what happens at startup:
+#   create  -> db.create_all() (quick local runs, the benchmark; default for SQLite)
+#   migrate -> alembic upgrade head (single-process deployments)
+#   none    -> nothing, run `flask --app app db-upgrade` as a deploy step (default for PostgreSQL)
+
+# --- Settings (override with environment variables) ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL') # safe with WAL, fsync only at checkpoints
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB', 64 * 1024))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800)) # seconds, under typical server idle timeouts
+SCHEMA_MODES = ('create', 'migrate', 'none')
+MIGRATIONS_DIR = os.path.join(BASE_DIR, 'migrations')
+
+def database_uri(default):
+    uri = os.environ.get('DATABASE_URL', default)
+    # Heroku-style URLs; SQLAlchemy only knows "postgresql://"
+    if uri.startswith('postgres://'): uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+def schema_mode(uri):
+    mode = os.environ.get('DB_SCHEMA') or ('create' if uri.startswith('sqlite') else 'none')
+    if mode not in SCHEMA_MODES: raise ValueError(f"DB_SCHEMA must be one of {', '.join(SCHEMA_MODES)}, not {mode!r}")
+    return mode
+
+def engine_options(uri):
+    # -> SQLALCHEMY_ENGINE_OPTIONS
+    if uri.startswith('sqlite'):
+        # The driver's own lock wait, on top of PRAGMA busy_timeout
+        return {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE, "pool_pre_ping": True}
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL") # readers no longer block the writer
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cursor.close()
+
+def configure(engine):
+    # Call before the first connection is made
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _sqlite_pragmas)
+        metrics.log("DB", backend="sqlite", journal_mode="wal", busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS, synchronous=SQLITE_SYNCHRONOUS)
+    else:
+        metrics.log("DB", backend=engine.dialect.name, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+
+def has_schema(engine):
+    return inspect(engine).has_table('stat')
+
+# --- Migrations (Alembic, optional: pip install alembic) ---
+def _alembic():
+    try:
+        from alembic import command
+        from alembic.config import Config
+    except ImportError:
+        raise RuntimeError("Migrations need Alembic (pip install alembic)")
+    config = Config(os.path.join(BASE_DIR, 'alembic.ini'))
+    config.set_main_option('script_location', MIGRATIONS_DIR)
+    return command, config
+
+def upgrade(engine, metadata, revision='head'):
+    command, config = _alembic()
+    with engine.begin() as connection:
+        # migrations/env.py runs on this connection instead of importing the app
+        config.attributes.update(connection=connection, metadata=metadata)
+        command.upgrade(config, revision)
+
+def revision(engine, metadata, message):
+    # New migration from the difference between the models and the database
+    command, config = _alembic()
+    with engine.begin() as connection:
+        config.attributes.update(connection=connection, metadata=metadata)
+        return command.revision(config, message=message, autogenerate=True)
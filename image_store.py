@@ -0,0 +1,152 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import cv2
+from werkzeug.utils import secure_filename
+
+# --- Image storage: content-addressed originals, cached WebP variants, cold archive ---
+# An upload is streamed to disk in chunks while it is hashed, then stored once per
+# content as <hot>/ab/<hash>.jpg; the same photo uploaded twice (or under another
+# name) takes no extra space. Its key, "<hash>-<original name>.jpg", is what
+# Parcel.parcel_name keeps, so search by file name still works. Keys from before
+# this layout are plain file names directly in <hot>.
+# Pages show WebP variants (thumb / preview), made on first request and cached;
+# they never change for a key, so browsers may keep them for a year.
+# Photos of completed batches can be moved to a cold directory, optionally
+# downscaled and re-encoded on the way (`flask --app app archive-images`).
+
+# --- Settings (override with environment variables) ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HOT_DIR = os.environ.get('IMAGE_DIR', os.path.join(BASE_DIR, 'static', 'uploads'))
+COLD_DIR = os.environ.get('IMAGE_ARCHIVE_DIR', os.path.join(HOT_DIR, 'archive'))
+VARIANT_DIR = os.path.join(HOT_DIR, 'variants')
+TMP_DIR = os.path.join(HOT_DIR, 'tmp')
+VARIANTS = {"thumb": (int(os.environ.get('IMAGE_THUMB_PX', 320)), 70), # longest side, WebP quality
+            "preview": (int(os.environ.get('IMAGE_PREVIEW_PX', 1280)), 80)}
+ARCHIVE_MODE = os.environ.get('IMAGE_ARCHIVE_MODE', 'recompress') # off | move | recompress
+ARCHIVE_DAYS = int(os.environ.get('IMAGE_ARCHIVE_DAYS', 30)) # after batch completion
+ARCHIVE_MAX_PX = int(os.environ.get('IMAGE_ARCHIVE_MAX_PX', 2048))
+ARCHIVE_QUALITY = int(os.environ.get('IMAGE_ARCHIVE_QUALITY', 75))
+CACHE_SECONDS = 365 * 24 * 3600
+EXTENSIONS = ('.jpg', '.jpeg', '.png')
+HASH_LENGTH = 20 # hex digits = 80 bits
+CHUNK_SIZE = 1024 * 1024
+KEY = re.compile(r'^([0-9a-f]{%d})-[\w.-]*?(\.jpg|\.png)$' % HASH_LENGTH)
+
+for _path in (HOT_DIR, TMP_DIR):
+    os.makedirs(_path, exist_ok=True)
+
+def _locations(key):
+    # -> (hot path, cold path, variant stem) for a key, or None for a key that is not ours
+    m = KEY.match(key or '')
+    if m:
+        digest, ext = m.groups()
+        blob = os.path.join(digest[:2], digest + ext)
+        return os.path.join(HOT_DIR, blob), os.path.join(COLD_DIR, blob), os.path.join(digest[:2], digest)
+    if not key or secure_filename(key) != key: return None
+    return os.path.join(HOT_DIR, key), os.path.join(COLD_DIR, 'legacy', key), os.path.join('legacy', os.path.splitext(key)[0])
+
+def label(key):
+    # The original file name, for display
+    m = KEY.match(key or '')
+    return key[len(m.group(1)) + 1:] if m else key
+
+def is_image_name(filename):
+    return (filename or '').lower().endswith(EXTENSIONS)
+
+def save(stream, filename):
+    # Copy a file-like object to the store in chunks; returns its key
+    stem, ext = os.path.splitext(os.path.basename(filename or ''))
+    ext = '.jpg' if ext.lower() == '.jpeg' else ext.lower()
+    # Split first: secure_filename drops non-ASCII names whole ("写真.jpg" -> "jpg")
+    stem = secure_filename(stem)
+    if ext not in ('.jpg', '.png'): raise ValueError(f"not a JPEG/PNG image: {filename}")
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=TMP_DIR, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk); out.write(chunk)
+        key = f"{digest.hexdigest()[:HASH_LENGTH]}-{stem[:60] or 'image'}{ext}"
+        hot = _locations(key)[0]
+        if os.path.exists(hot): os.remove(tmp) # same content already stored
+        else:
+            os.makedirs(os.path.dirname(hot), exist_ok=True)
+            os.replace(tmp, hot)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    return key
+
+def path_for(key):
+    # Where the original is now (hot first, then the archive); None for an invalid key
+    locations = _locations(key)
+    if not locations: return None
+    hot, cold, _ = locations
+    return cold if not os.path.exists(hot) and os.path.exists(cold) else hot
+
+# --- Variants ---
+def _resize(image, longest):
+    h, w = image.shape[:2]
+    scale = longest / max(h, w)
+    if scale >= 1: return image
+    return cv2.resize(image, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+
+def _write_atomic(path, data):
+    # Temp file in the target directory: os.replace can't cross file systems (the cold tier may be another disk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as out: out.write(data)
+    os.replace(tmp, path)
+
+def variant(key, size):
+    # Path of the WebP variant (made now if missing), or None if the original is gone
+    locations = _locations(key)
+    if not locations or size not in VARIANTS: return None
+    path = os.path.join(VARIANT_DIR, size, locations[2] + '.webp')
+    if os.path.exists(path): return path
+    source = path_for(key)
+    image = cv2.imread(source, cv2.IMREAD_COLOR) if os.path.exists(source) else None
+    if image is None: return None
+    longest, quality = VARIANTS[size]
+    ok, data = cv2.imencode('.webp', _resize(image, longest), [cv2.IMWRITE_WEBP_QUALITY, quality])
+    if not ok: return None
+    _write_atomic(path, data.tobytes())
+    return path
+
+# --- Archive tier ---
+def archive(key, mode=ARCHIVE_MODE):
+    # Move one original to the cold directory; returns (bytes before, bytes after)
+    locations = _locations(key)
+    if mode == 'off' or not locations: return 0, 0
+    hot, cold, _ = locations
+    if not os.path.exists(hot): return 0, 0
+    before = os.path.getsize(hot)
+    os.makedirs(os.path.dirname(cold), exist_ok=True)
+    data, scale = None, 1.0
+    if mode == 'recompress':
+        image = cv2.imread(hot, cv2.IMREAD_COLOR)
+        if image is not None:
+            small = _resize(image, ARCHIVE_MAX_PX)
+            params = [cv2.IMWRITE_JPEG_QUALITY, ARCHIVE_QUALITY] if hot.endswith('.jpg') else [cv2.IMWRITE_PNG_COMPRESSION, 9]
+            ok, encoded = cv2.imencode(os.path.splitext(hot)[1], small, params)
+            if ok and len(encoded) < before: data, scale = encoded.tobytes(), small.shape[1] / image.shape[1]
+    if data is None: shutil.move(hot, cold)
+    else:
+        _write_atomic(cold, data)
+        os.remove(hot)
+    # The analyzer's side files follow the photo: boxes are rescaled with it, the box drawing is redrawn on demand
+    stem = os.path.splitext(hot)[0]
+    for extra in glob.glob(glob.escape(stem) + '_predicted.*'): os.remove(extra)
+    boxes = stem + '_boxes.json'
+    if os.path.exists(boxes):
+        with open(boxes) as f: rows = json.load(f)
+        rows = [[round(v * scale, 2) for v in row[:4]] + row[4:] for row in rows]
+        _write_atomic(os.path.splitext(cold)[0] + '_boxes.json', json.dumps(rows).encode())
+        os.remove(boxes)
+    return before, os.path.getsize(cold)
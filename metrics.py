@@ -0,0 +1,149 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+# --- Metrics + structured logs + sampling profiler (no client libraries) ---
+# Counters and histograms live in this process and are rendered in the
+# Prometheus text format by /metrics. Under gunicorn every worker keeps its
+# own numbers; Prometheus adds them up when each worker is scraped (or give
+# each worker its own port), the same as prometheus_client without
+# multiprocess mode.
+
+# --- Settings (override with environment variables) ---
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text') # text | json
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_registry = []
+_lock = threading.Lock()
+
+def _label_text(names, values):
+    if not names: return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with _lock: self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with _lock: items = list(self._values.items())
+        return [(self.name + _label_text(self.labels, key), value) for key, value in items]
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._values = {} # labels -> [count per bucket..., +Inf count, sum]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with _lock:
+            row = self._values.get(key)
+            if row is None: row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: row[i] += 1; break
+            else: row[len(self.buckets)] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try: yield
+        finally: self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with _lock: items = [(key, list(row)) for key, row in self._values.items()]
+        out = []
+        for key, row in items:
+            total = 0
+            for bound, n in zip(self.buckets + ('+Inf',), row[:-1]):
+                total += n
+                out.append((self.name + '_bucket' + _label_text(self.labels + ('le',), key + (bound,)), total))
+            out.append((self.name + '_count' + _label_text(self.labels, key), total))
+            out.append((self.name + '_sum' + _label_text(self.labels, key), row[-1]))
+        return out
+
+class Gauge:
+    # Read when scraped: fn() -> number
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn):
+        self.name, self.help, self.fn = name, help, fn
+        _registry.append(self)
+
+    def samples(self):
+        try: return [(self.name, self.fn())]
+        except Exception: return []
+
+def render():
+    lines = []
+    for metric in _registry:
+        samples = metric.samples()
+        if not samples: continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name} {float(value):.6g}" for name, value in samples)
+    return '\n'.join(lines) + '\n'
+
+# --- Structured logs ---
+def log(event, **fields):
+    # One line per event: JSON for a log shipper, or the usual "--- [event] ---" line
+    if LOG_FORMAT == 'json':
+        print(json.dumps(dict(ts=round(time.time(), 3), event=event, **fields), default=str), flush=True)
+    else:
+        message = [str(fields.pop('message'))] if 'message' in fields else []
+        print(f"--- [{event}] {' '.join(message + [f'{k}={v}' for k, v in fields.items()])} ---")
+
+# --- Sampling profiler: one request, one thread ---
+class Profiler:
+    # Samples the target thread's stack every PROFILE_INTERVAL and counts each
+    # distinct stack; save() writes them in the collapsed format flamegraph.pl
+    # and speedscope read ("frame;frame;frame count").
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = _Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack: self.stacks[';'.join(reversed(stack))] += 1
+
+    def save(self, name):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.folded")
+        with open(path, 'w') as f:
+            for stack, n in self.stacks.most_common(): f.write(f"{stack} {n}\n")
+        return path
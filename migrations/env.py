@@ -0,0 +1,45 @@
+import os
+import sys
+
+from alembic import context
+
+# --- Alembic environment ---
+# `flask --app app db-upgrade` hands over its connection and metadata through
+# config.attributes (database.upgrade). Plain `alembic ...` from the shell
+# imports the app instead, without letting it create tables on import.
+config = context.config
+connection = config.attributes.get('connection')
+metadata = config.attributes.get('metadata')
+url = config.get_main_option('sqlalchemy.url')
+
+if metadata is None:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DB_SCHEMA', 'none')
+    from app import app, db
+    metadata = db.metadata
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    with app.app_context(): engine = db.engine
+
+# The search index (search_index.py) manages its own FTS5 tables and triggers
+FTS_PREFIXES = ('parcel_fts', 'batch_fts', 'vehicle_fts')
+
+def include_object(obj, name, type_, reflected, compare_to):
+    return not (type_ == 'table' and name.startswith(FTS_PREFIXES))
+
+def run(connection):
+    # render_as_batch: SQLite can't ALTER most things, so autogenerate copies the table instead
+    context.configure(connection=connection, target_metadata=metadata, include_object=include_object,
+                      render_as_batch=connection.dialect.name == 'sqlite', compare_type=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+if context.is_offline_mode():
+    # `alembic upgrade head --sql`: print the SQL for a DBA instead of running it
+    context.configure(url=url, target_metadata=metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+elif connection is not None:
+    run(connection)
+else:
+    with engine.begin() as connection:
+        run(connection)
@@ -0,0 +1,93 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-16 23:13:58
+
+Everything db.create_all() used to build. IF NOT EXISTS throughout, so a
+database created before migrations existed (project.db) is adopted as-is and
+only gets what it is missing (the stat table, the indexes).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=30), nullable=False),
+        sa.Column('password_hash', sa.String(length=128), nullable=True),
+        sa.Column('is_admin', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username'),
+        if_not_exists=True)
+    op.create_table('vehicle',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('vehicle_uid', sa.String(length=20), nullable=False),
+        sa.Column('vehicle_type', sa.String(length=30), nullable=False),
+        sa.Column('plate_number', sa.String(length=20), nullable=False),
+        sa.Column('driver_name', sa.String(length=100), nullable=True),
+        sa.Column('color', sa.String(length=30), nullable=True),
+        sa.Column('capacity_m3', sa.Float(), nullable=False),
+        sa.Column('status', sa.String(length=30), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('plate_number'),
+        sa.UniqueConstraint('vehicle_uid'),
+        if_not_exists=True)
+    op.create_table('batch',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('batch_name', sa.String(length=50), nullable=False),
+        sa.Column('batch_type', sa.String(length=20), nullable=False),
+        sa.Column('current_volume', sa.Float(), nullable=True),
+        sa.Column('max_volume', sa.Float(), nullable=True),
+        sa.Column('max_capacity', sa.Float(), nullable=True),
+        sa.Column('status', sa.String(length=30), nullable=True),
+        sa.Column('completion_time', sa.DateTime(), nullable=True),
+        sa.Column('vehicle_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['vehicle_id'], ['vehicle.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('batch_name'),
+        if_not_exists=True)
+    op.create_table('parcel',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('external_parcel_id', sa.String(length=100), nullable=True),
+        sa.Column('dimensions', sa.String(length=50), nullable=True),
+        sa.Column('weight', sa.Float(), nullable=True),
+        sa.Column('estimated_volume', sa.Float(), nullable=True),
+        sa.Column('parcel_name', sa.String(length=100), nullable=True),
+        sa.Column('delivery_address', sa.String(length=200), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('batch_id', sa.Integer(), nullable=True),
+        sa.Column('created_time', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['batch_id'], ['batch.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True)
+    op.create_table('stat',
+        sa.Column('metric', sa.String(length=30), nullable=False),
+        sa.Column('bucket', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('metric', 'bucket'),
+        if_not_exists=True)
+
+    op.create_index('ix_vehicle_driver_name_lower', 'vehicle', [sa.text('lower(driver_name)')], if_not_exists=True)
+    op.create_index('ix_batch_batch_type', 'batch', ['batch_type'], if_not_exists=True)
+    op.create_index('ix_batch_status', 'batch', ['status'], if_not_exists=True)
+    op.create_index('ix_batch_vehicle_id', 'batch', ['vehicle_id'], if_not_exists=True)
+    op.create_index('ix_parcel_batch_id', 'parcel', ['batch_id'], if_not_exists=True)
+    op.create_index('ix_parcel_created_time', 'parcel', ['created_time'], if_not_exists=True)
+    op.create_index('ix_parcel_external_parcel_id', 'parcel', ['external_parcel_id'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_table('stat')
+    op.drop_table('parcel')
+    op.drop_table('batch')
+    op.drop_table('vehicle')
+    op.drop_table('user')
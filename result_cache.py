@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Settings (override with environment variables) ---
+CACHE_PATH = os.environ.get('AI_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analysis_cache.db'))
+CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_SIZE', 5000))
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# --- Result Cache: image content hash + model version -> AI result dict ---
+class ResultCache:
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS result_cache (key TEXT PRIMARY KEY, result TEXT NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_result_cache_last_used ON result_cache (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(content_hash, model_version):
+        return f"{model_version}:{content_hash}"
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM result_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Touch the entry so LRU eviction keeps it
+            self._conn.execute("UPDATE result_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key, result):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO result_cache (key, result, last_used) VALUES (?, ?, ?)", (key, json.dumps(result), time.time()))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute("DELETE FROM result_cache WHERE key IN (SELECT key FROM result_cache ORDER BY last_used ASC LIMIT ?)", (count - self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM result_cache")
+            self._conn.commit()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": size, "max_entries": self.max_entries,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
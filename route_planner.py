@@ -0,0 +1,194 @@
+import csv
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+# --- Route planning: addresses -> zones -> ordered stops (all local, no network) ---
+# Coordinates come from a CSV next to the app (address,lat,lon[,zone]). Rows
+# can be a full address or a 5-digit postcode, which catches every address
+# containing that postcode. A row named "depot" is where routes start.
+# Stops are grouped by zone, zones are visited nearest-first, and the stops
+# inside each zone are ordered with nearest-neighbour + 2-opt.
+
+# --- Settings (override with environment variables) ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GEOCODE_PATH = os.environ.get('ROUTE_GEOCODE_FILE', os.path.join(BASE_DIR, 'geocodes.csv'))
+ZONE_SIZE_KM = float(os.environ.get('ROUTE_ZONE_KM', 5.0)) # grid cell for rows without a zone
+TWO_OPT_PASSES = int(os.environ.get('ROUTE_2OPT_PASSES', 50))
+ROUTE_CACHE_SIZE = 256
+UNKNOWN_ZONE = 'Unknown'
+EARTH_RADIUS_KM = 6371.0
+
+ABBREVIATIONS = {'JLN': 'JALAN', 'JL': 'JALAN', 'TMN': 'TAMAN', 'LRG': 'LORONG', 'KG': 'KAMPUNG', 'BDR': 'BANDAR',
+                 'RD': 'ROAD', 'ST': 'STREET', 'AVE': 'AVENUE', 'BLK': 'BLOCK', 'NO': ''}
+POSTCODE = re.compile(r'\b\d{5}\b')
+
+def normalize_address(address):
+    # "Jln. Tebrau, No 12" and "JALAN TEBRAU 12" -> the same key
+    words = re.sub(r'[^A-Z0-9]+', ' ', (address or '').upper()).split()
+    return ' '.join(w for w in (ABBREVIATIONS.get(w, w) for w in words) if w)
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def distance_matrix(points):
+    # points: (n, 2) lat/lon -> (n, n) km, one broadcast instead of n² calls
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    lat, lon = points[:, 0], points[:, 1]
+    return haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :]).astype(np.float32)
+
+def grid_zone(lat, lon):
+    cell = ZONE_SIZE_KM / 111.0 # ~km per degree
+    return f"Grid {int(lat // cell)}:{int(lon // cell)}"
+
+# --- Geocoder: local lookup table, reloaded when the file changes ---
+class Geocoder:
+    def __init__(self, path=GEOCODE_PATH):
+        self.path = path
+        self.version = None # file mtime the table was read at
+        self.depot = None
+        self._table = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock: self._refresh()
+
+    def _refresh(self):
+        try: mtime = os.path.getmtime(self.path)
+        except OSError: mtime = None
+        if mtime == self.version: return
+        table, depot = {}, None
+        if mtime is not None:
+            with open(self.path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    try: lat, lon = float(row['lat']), float(row['lon'])
+                    except (KeyError, TypeError, ValueError): continue
+                    key = normalize_address(row.get('address'))
+                    if key == 'DEPOT': depot = (lat, lon); continue
+                    table[key] = (lat, lon, (row.get('zone') or '').strip() or grid_zone(lat, lon))
+        self._table, self.depot, self.version = table, depot, mtime
+        self._cache = {}
+        metrics.log("Route", message="geocode table loaded", entries=len(table))
+
+    def locate(self, address):
+        # -> (lat, lon, zone) or None
+        with self._lock:
+            self._refresh()
+            key = normalize_address(address)
+            if key not in self._cache:
+                hit = self._table.get(key)
+                if hit is None:
+                    for postcode in POSTCODE.findall(key):
+                        hit = self._table.get(postcode)
+                        if hit: break
+                self._cache[key] = hit
+            return self._cache[key]
+
+    def locate_many(self, addresses):
+        return {a: self.locate(a) for a in set(addresses)}
+
+geocoder = Geocoder()
+
+# --- Ordering ---
+def _nearest_neighbour(dist):
+    # Node 0 is the fixed start; greedy walk to the closest unvisited node
+    n = len(dist)
+    route = [0]
+    visited = np.zeros(n, dtype=bool); visited[0] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[route[-1]])
+        nxt = int(row.argmin()); route.append(nxt); visited[nxt] = True
+    return np.array(route)
+
+def _two_opt(route, dist, passes=TWO_OPT_PASSES):
+    # Open path with a fixed start: a zero-distance dummy end turns it into a
+    # closed tour, then every reversal r[i+1..j] is scored at once per i.
+    n = len(dist)
+    ext = np.zeros((n + 1, n + 1), dtype=dist.dtype); ext[:n, :n] = dist
+    r = np.append(route, n)
+    for _ in range(passes):
+        improved = False
+        for i in range(len(r) - 3):
+            a, b = r[i], r[i + 1]
+            c, d = r[i + 2:-1], r[i + 3:]
+            delta = ext[a, c] + ext[b, d] - ext[a, b] - ext[c, d]
+            k = int(delta.argmin())
+            if delta[k] < -1e-6:
+                j = i + 2 + k
+                r[i + 1:j + 1] = r[i + 1:j + 1][::-1]
+                improved = True
+        if not improved: break
+    return r[:-1]
+
+def order_points(points, start=None):
+    # Visiting order for `points` (lat/lon), starting from `start` (or the point farthest from the middle)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) <= 1: return np.arange(len(points))
+    if start is None:
+        start = points[int(haversine_km(*points.mean(axis=0), points[:, 0], points[:, 1]).argmax())]
+    dist = distance_matrix(np.vstack([start, points]))
+    route = _two_opt(_nearest_neighbour(dist), dist)
+    return route[1:] - 1
+
+def zone_centroids(hits):
+    # Geocoder hits (or None) -> {zone: mean (lat, lon)}, None for the Unknown zone
+    members = {}
+    for hit in hits:
+        if hit: members.setdefault(hit[2], []).append(hit[:2])
+        else: members.setdefault(UNKNOWN_ZONE, [])
+    return {z: tuple(np.mean(points, axis=0)) if points else None for z, points in members.items()}
+
+def order_zones(centroids, start=None):
+    # centroids: {zone: (lat, lon)} -> zone names in visiting order, Unknown last
+    names = [z for z in centroids if z != UNKNOWN_ZONE]
+    order = order_points([centroids[z] for z in names], start if start is not None else geocoder.depot)
+    return [names[i] for i in order] + ([UNKNOWN_ZONE] if UNKNOWN_ZONE in centroids else [])
+
+# --- Batch route: (address, parcel count) rows -> ordered stops ---
+_route_cache = OrderedDict()
+_route_lock = threading.Lock()
+
+def plan_route(stops):
+    geocoder.refresh()
+    key = (geocoder.version, tuple(sorted((a or '', n) for a, n in stops)))
+    with _route_lock:
+        if key in _route_cache:
+            _route_cache.move_to_end(key); return _route_cache[key]
+    route = _plan_route(key[1])
+    with _route_lock:
+        _route_cache[key] = route
+        if len(_route_cache) > ROUTE_CACHE_SIZE: _route_cache.popitem(last=False)
+    return route
+
+def _plan_route(stops):
+    located = geocoder.locate_many(a for a, _ in stops)
+    zones = {}
+    for address, parcels in stops:
+        hit = located[address]
+        zones.setdefault(hit[2] if hit else UNKNOWN_ZONE, []).append((address, parcels, hit))
+
+    ordered, position = [], geocoder.depot
+    for zone in order_zones(zone_centroids(located.values()), position):
+        rows = zones[zone]
+        if zone != UNKNOWN_ZONE:
+            rows = [rows[i] for i in order_points([h[:2] for _, _, h in rows], position)]
+            position = rows[-1][2][:2]
+        ordered.extend((zone, row) for row in rows)
+
+    result, previous, total = [], geocoder.depot, 0.0
+    for zone, (address, parcels, hit) in ordered:
+        leg = None
+        if hit:
+            if previous is not None: leg = round(float(haversine_km(previous[0], previous[1], hit[0], hit[1])), 2); total += leg
+            previous = hit[:2]
+        result.append({"address": address, "zone": zone, "parcels": parcels, "leg_km": leg})
+    return {"stops": result, "total_km": round(total, 2), "zones": len(zones),
+            "unlocated": sum(1 for s in result if s["zone"] == UNKNOWN_ZONE)}
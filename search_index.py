@@ -0,0 +1,84 @@
+from sqlalchemy import text, column, Integer
+
+import metrics
+
+# --- Full-text search (SQLite FTS5, trigram tokenizer) ---
+# Each searchable table gets an external-content FTS5 table kept in sync by
+# triggers, so bulk SQL deletes/updates stay indexed too. The trigram
+# tokenizer matches any substring of 3+ characters, the same results the old
+# ilike('%term%') gave, without scanning the base table.
+SEARCH_TABLES = {
+    "parcel": ["external_parcel_id", "parcel_name"],
+    "batch": ["batch_name"],
+    "vehicle": ["plate_number", "driver_name"],
+}
+MIN_TERM_LENGTH = 3 # trigram needs at least 3 characters
+
+available = False
+
+def fts_table(table):
+    return f"{table}_fts"
+
+def _statements(table, columns):
+    fts = fts_table(table)
+    cols = ", ".join(columns)
+    new_vals = ", ".join(f"new.{c}" for c in columns)
+    old_vals = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END",
+        # Only fire when a searchable column changes, not on every volume/status update
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+    ]
+
+def install(engine):
+    # Create the FTS tables + triggers (once) and fill them for an existing database
+    global available
+    if engine.dialect.name != "sqlite":
+        available = False
+        return available
+    try:
+        with engine.begin() as conn:
+            existing = {r[0] for r in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+            for table, columns in SEARCH_TABLES.items():
+                for stmt in _statements(table, columns):
+                    conn.execute(text(stmt))
+                if fts_table(table) not in existing:
+                    conn.execute(text(f"INSERT INTO {fts_table(table)}({fts_table(table)}) VALUES ('rebuild')"))
+        available = True
+        metrics.log("Search", message="FTS5 trigram index ready")
+    except Exception as e:
+        # Old SQLite builds without FTS5 / trigram: fall back to ilike scans
+        metrics.log("Search", message="FTS5 unavailable, using LIKE search", error=str(e))
+        available = False
+    return available
+
+def rebuild(engine):
+    with engine.begin() as conn:
+        for table in SEARCH_TABLES:
+            conn.execute(text(f"INSERT INTO {fts_table(table)}({fts_table(table)}) VALUES ('rebuild')"))
+
+def suspend(conn, table):
+    # Bulk loads: drop the sync triggers, resume() re-indexes the whole table in one pass
+    if not available: return
+    for suffix in ("ai", "ad", "au"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {fts_table(table)}_{suffix}"))
+
+def resume(conn, table):
+    if not available: return
+    for stmt in _statements(table, SEARCH_TABLES[table]):
+        conn.execute(text(stmt))
+    conn.execute(text(f"INSERT INTO {fts_table(table)}({fts_table(table)}) VALUES ('rebuild')"))
+
+def can_match(term):
+    return available and len(term) >= MIN_TERM_LENGTH
+
+def match_ids(table, term):
+    # Row ids whose searchable columns contain `term` (case-insensitive)
+    phrase = '"' + term.replace('"', '""') + '"'
+    return text(f"SELECT rowid FROM {fts_table(table)} WHERE {fts_table(table)} MATCH :q").bindparams(q=phrase).columns(column('rowid', Integer))
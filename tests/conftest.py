@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# benchmark points DATABASE_URL at a throwaway SQLite file, so it has to be imported before app
+import benchmark
+from app import app, db
+
+# The repo keeps its templates next to app.py
+app.template_folder = ROOT
+
+@pytest.fixture
+def admin_client():
+    def make(admin_id):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s['user_id'], s['username'], s['is_admin'] = admin_id, 'admin', True
+        return client
+    return make
+
+@pytest.fixture
+def count_queries():
+    # -> counter; counter[0] is the number of SQL statements run since it was last reset
+    counter = [0]
+    def count(*args): counter[0] += 1
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    yield counter
+    event.remove(engine, 'before_cursor_execute', count)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+import batch_planner
+
+def one_at_a_time(volumes, limits, best, bounds):
+    # Textbook FFD / BFD, one parcel per step, with the same zone rule as _pack
+    room, used = limits.astype(float).copy(), np.zeros(len(limits), dtype=bool)
+    assigned, last, eps = np.full(len(volumes), -1), -1, batch_planner.EPS
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        allowed = ~used
+        if last >= 0: allowed[last] = True
+        for i in range(start, stop):
+            fits = allowed & (room + eps >= volumes[i])
+            if not fits.any(): continue
+            b = int(np.argmax(fits))
+            if best and (fits & used).any(): b = int(np.where(fits & used, room, np.inf).argmin())
+            assigned[i], used[b], last = b, True, b
+            room[b] -= volumes[i]
+    return assigned
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('name', ['first-fit-decreasing', 'best-fit-decreasing'])
+def test_runs_place_parcels_like_one_at_a_time(seed, name):
+    rng = np.random.default_rng(seed)
+    volumes = np.sort(rng.choice([rng.uniform(0.001, 0.3), 0.05, 0.02], size=400) * rng.uniform(0.5, 1.5, 400))[::-1]
+    limits = np.sort(rng.choice([1.5, 3.0, 6.0, 12.0], size=30))[::-1] * 0.9
+    zones = np.sort(rng.integers(0, 4, 400)) if seed % 2 else np.zeros(400, dtype=int)
+    order = np.lexsort((-volumes, zones))
+    volumes, zones = volumes[order], zones[order]
+    bounds = [0, *(np.flatnonzero(np.diff(zones)) + 1).tolist(), len(volumes)]
+    got = batch_planner._pack(volumes, limits, batch_planner.STRATEGIES[name], bounds)
+    assert (got == one_at_a_time(volumes, limits, name.startswith('best'), bounds)).all()
@@ -0,0 +1,20 @@
+import benchmark
+from app import app, Stat, rebuild_stats
+
+def stat_values():
+    with app.app_context():
+        return {(s.metric, s.bucket): s.value for s in Stat.query.all() if s.value}
+
+def test_concurrent_confirms_lose_nothing():
+    # Many admins confirming at once: every parcel saved, batch volumes and counters exact
+    admin_id = benchmark.seed_database(2000, 100, 20)
+    result = benchmark.stress_confirm(admin_id, threads=8, per_thread=25)
+    assert result['failed_requests'] == 0
+    assert result['parcels_saved'] == 8 * 25
+    assert result['max_volume_drift'] < 1e-6
+    assert result['overfilled_open_batches'] == 0
+
+    # The counters bumped by each request must match a full recount
+    counted = stat_values()
+    with app.app_context(): rebuild_stats()
+    assert counted == stat_values()
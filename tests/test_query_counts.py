@@ -0,0 +1,15 @@
+import pytest
+
+import benchmark
+
+# SQL statements per page view: list pages must not grow with the data (no N+1)
+EXPECTED = {'/parcel_list': 1, '/batch_list': 2, '/batch/1': 3}
+
+@pytest.mark.parametrize('size', [(500, 50, 20), (5000, 400, 100)])
+def test_queries_per_request_are_constant(size, admin_client, count_queries):
+    client = admin_client(benchmark.seed_database(*size))
+    for url, expected in EXPECTED.items():
+        assert client.get(url).status_code == 200 # warm up: cached counts, lazy setup
+        count_queries[0] = 0
+        assert client.get(url).status_code == 200
+        assert count_queries[0] == expected, f"{url} ran {count_queries[0]} queries with {size[0]} parcels"
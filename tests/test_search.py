@@ -0,0 +1,20 @@
+import benchmark
+from app import app, db, Parcel, parcel_search_filter
+
+def found(term):
+    with app.app_context():
+        return {p.external_parcel_id for p in Parcel.query.filter(parcel_search_filter(term))}
+
+def test_id_shaped_terms_search_ids_only():
+    admin_id = benchmark.seed_database(50, 5, 3) # ids SPX2000000000..SPX2000000049, names parcel_<i>.jpg
+    with app.app_context():
+        db.session.add_all([Parcel(external_parcel_id='OCR1', parcel_name='relabel SPX200000001 box.jpg', estimated_volume=0.01, user_id=admin_id),
+                            Parcel(external_parcel_id='OCR2', parcel_name='from SPX9 lot.jpg', estimated_volume=0.01, user_id=admin_id)])
+        db.session.commit()
+
+    # An exact ID, or the start of one, lists those IDs only: the name containing it is left out
+    assert found('SPX2000000001') == {'SPX2000000001'}
+    assert found('spx200000001') == {f'SPX20000000{i}' for i in range(10, 20)}
+    # No ID starts with the term -> substring search over ID and name
+    assert found('SPX9') == {'OCR2'}
+    assert found('relabel') == {'OCR1'}